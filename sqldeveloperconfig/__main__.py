@@ -7,6 +7,9 @@ Examples:
   python3 -m sqldeveloperconfig manual --help
   python3 -m sqldeveloperconfig add_connection --help
   python3 -m sqldeveloperconfig set_passwords --help
+  python3 -m sqldeveloperconfig rekey --help
+  python3 -m sqldeveloperconfig diff --help
+  python3 -m sqldeveloperconfig sync --help
 
   # Automatic file mode, show all connections and passwords on command line
   python3 -m sqldeveloperconfig auto
@@ -22,25 +25,77 @@ Examples:
   # Add a connection from a json config file
   python3 -m sqldeveloperconfig add_connection --json-files interactive_connection.json
 
+  # Add many connections, one JSON object per line, from stdin
+  generate_connections | python3 -m sqldeveloperconfig add_connection --json-files -
+
   # Set passwords matching regex
   python3 -m sqldeveloperconfig set_passwords \\
     --host-regex '^.*localhost.*$' \\
     --user-regex 'system' \\
     --password 'oracle'
+
+  # After db.system.id changed, make the passwords encrypted with the old one readable again
+  python3 -m sqldeveloperconfig rekey --old-db-system-id 1d5dbbd1-a91e-4298-9a5d-e13b55030b8f
+
+  # Process up to 4 installs of SQLDeveloper at once
+  python3 -m sqldeveloperconfig --jobs 4 auto
+
+  # List the connections to one host on port 1522 whose password would be set, without changing anything
+  python3 -m sqldeveloperconfig set_passwords \\
+    --where hostname=db1.example.com \\
+    --where port=1522 \\
+    --match 'folder=^prod' \\
+    --dry-run
+
+  # Show all connections and passwords as one JSON record per line, streamed as they are decrypted
+  python3 -m sqldeveloperconfig auto --format ndjson
+
+  # Reuse the parsed files of the previous run while they are unchanged, for instance when run every few minutes
+  python3 -m sqldeveloperconfig --cache auto
+
+  # Show how the connections of two installs differ, with the passwords compared decrypted
+  python3 -m sqldeveloperconfig diff --compare-passwords \\
+    ~/.sqldeveloper/system19.2.1.247.2212/o.jdeveloper.db.connection/connections.xml \\
+    ~/.sqldeveloper/system20.4.0.379.2205/o.jdeveloper.db.connection/connections.xml
+
+  # Push a catalog of connections to every install, keeping the changes made in each one since the last sync
+  python3 -m sqldeveloperconfig sync --json-files catalog.json
+
+  # Serve requests from memory, then send them to the server instead of reading the files every time
+  python3 -m sqldeveloperconfig --socket /tmp/sqldeveloperconfig.sock serve &
+  python3 -m sqldeveloperconfig --socket /tmp/sqldeveloperconfig.sock auto
+
+  # Show where the time goes
+  python3 -m sqldeveloperconfig --profile auto
+
+  # Show the connections of every user on the machine
+  python3 -m sqldeveloperconfig --root '/home/*/.sqldeveloper' auto
 """
 
 
 import argparse
 import json
-import re
+import os
+import signal
+import sys
 from collections import OrderedDict
-from getpass import getpass
+from contextlib import ExitStack
+from io import StringIO
+from itertools import repeat
 
-from sqldeveloperconfig.connections import Connections, Connection
+# Modules only some subcommands need, such as diff, sync, query, the crypto backends, the process pool, the server or getpass, are imported where they are used
+from sqldeveloperconfig.connections import (
+    Connections,
+    iter_decrypted_connections,
+    check_connection_attrs,
+    add_to_all_connections,
+    connections_transaction,
+    install_lock,
+)
 from sqldeveloperconfig.constants import DEFAULT_CONN_ATTRS
 from sqldeveloperconfig.cryption import decrypt_v4
-from sqldeveloperconfig.util import find_all_connection_paths, ask_yes_no, ask_default
-from sqldeveloperconfig.preferences import read_db_system_id, find_pref_path, ProductPreferences
+from sqldeveloperconfig.profiling import get_timings, merge_timings, reset_timings
+from sqldeveloperconfig.util import find_all_connection_paths, ask_yes_no, ask_default, set_search_roots, iter_json_values
 
 EPILOG = __doc__
 
@@ -56,34 +111,188 @@ def mod_manual_show(args):
     return {"password": decrypted_password}
 
 
+def run_install(install_fn, args, connections_path, fn_args):
+    """
+    Runs install_fn for one install, returns (result, None) or (None, error message) so one failure does not stop the others
+    """
+    try:
+        return install_fn(args, connections_path, *fn_args), None
+    except Exception as ex:
+        return None, "{}: {}".format(type(ex).__name__, ex)
+
+
+def init_worker(roots, cache_dir, crypto_backend_name):
+    """
+    Applies the global options of the parent process in a worker, which only inherits them when started with fork
+    """
+    from sqldeveloperconfig.cache import set_cache_dir
+    from sqldeveloperconfig.crypto_backends import set_crypto_backend
+
+    set_search_roots(roots)
+    set_cache_dir(cache_dir)
+    set_crypto_backend(crypto_backend_name)
+
+
+def run_install_in_worker(install_fn, args, connections_path, fn_args):
+    """
+    run_install in a worker process, also returning the timings of the worker
+    """
+    reset_timings()
+    result, error = run_install(install_fn, args, connections_path, fn_args)
+    return result, error, get_timings()
+
+
+def map_installs(args, install_fn, connections_paths, *fn_args):
+    """
+    Calls install_fn(args, connections_path, *fn_args) for every install, on a pool of args.jobs processes.
+    Returns an OrderedDict of connections_path to result in the order of connections_paths.
+    Installs that failed are left out and their errors are added to args.install_errors.
+    """
+    if args.jobs > 1 and len(connections_paths) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        from sqldeveloperconfig.cache import get_cache_dir
+        from sqldeveloperconfig.crypto_backends import get_crypto_backend
+
+        # The backend is picked once here rather than benchmarked again in every worker
+        worker_options = (args.roots, get_cache_dir(), get_crypto_backend().name)
+        outcomes = []
+        with ProcessPoolExecutor(args.jobs, initializer=init_worker, initargs=worker_options) as executor:
+            for result, error, timings in executor.map(run_install_in_worker, repeat(install_fn), repeat(args), connections_paths, repeat(fn_args)):
+                merge_timings(timings)
+                outcomes.append((result, error))
+    else:
+        outcomes = [run_install(install_fn, args, connections_path, fn_args) for connections_path in connections_paths]
+    results = OrderedDict()
+    for connections_path, (result, error) in zip(connections_paths, outcomes):
+        if error is None:
+            results[connections_path] = result
+        else:
+            args.install_errors[connections_path] = error
+    return results
+
+
+def set_passwords_install(args, connections_path, query):
+    if args.dry_run:
+        return [conn_name for conn_name, conn in query.select(Connections(connections_path, streaming=True))]
+    with connections_transaction(connections_path) as connections:
+        names = [conn_name for conn_name, conn in query.select(connections)]
+        connections.set_passwords(OrderedDict((conn_name, args.password) for conn_name in names))
+    return names
+
+
+def make_set_passwords_matches(args):
+    matches = [("name", args.name_regex), ("user", args.user_regex), ("host", args.host_regex)]
+    return [(attr, pattern) for attr, pattern in matches if pattern != ".*"] + args.match
+
+
+def make_set_passwords_query(args):
+    from sqldeveloperconfig.query import ConnectionQuery
+
+    return ConnectionQuery(args.where, make_set_passwords_matches(args))
+
+
 def mod_set_passwords(args):
     """
-    Set passwords matching regexes
+    Set passwords matching regexes, or only list them with --dry-run
     """
+    query = make_set_passwords_query(args)
     all_names = []
-    for connections_path in find_all_connection_paths():
-        connections = Connections(connections_path)
-        for conn_name, conn in connections.items():
-            if re.search(args.name_regex, conn.name):
-                if re.search(args.user_regex, conn.user):
-                    if re.search(args.host_regex, conn.host):
-                        all_names.append(conn.name)
-                        conn.plaintext_password = args.password
-        connections.save_connections_and_folders(connections_path)
+    for names in map_installs(args, set_passwords_install, find_all_connection_paths(), query).values():
+        all_names += names
     return all_names
 
 
+def rekey_install(args, connections_path):
+    with connections_transaction(connections_path) as connections:
+        rekeyed = connections.rekey(args.old_db_system_id, args.new_db_system_id, args.jobs if args.jobs > 1 else None)
+    return OrderedDict([("rekeyed", rekeyed), ("db_system_id", connections.prod_prefs.db_system_id)])
+
+
+def mod_rekey(args):
+    """
+    Re-encrypt all saved passwords from one db.system.id to another
+    """
+    return map_installs(args, rekey_install, find_all_connection_paths())
+
+
+def auto_show_install(args, connections_path):
+    connections = Connections(connections_path, streaming=True)
+    conn_file = OrderedDict()
+    conn_file["connections"] = connections.to_json()
+    conn_file["db_system_id"] = connections.prod_prefs.db_system_id
+    return conn_file
+
+
+def iter_auto_show_records(args):
+    """
+    Yields one record per connection of every install, or one error record per install that failed
+    """
+    for connections_path in find_all_connection_paths():
+        try:
+            for conn in iter_decrypted_connections(connections_path):
+                record = OrderedDict([("install", connections_path), ("db_system_id", conn.db_system_id)])
+                record.update(conn.to_json())
+                yield record
+        except Exception as ex:
+            args.install_errors[connections_path] = "{}: {}".format(type(ex).__name__, ex)
+            yield OrderedDict([("install", connections_path), ("error", args.install_errors[connections_path])])
+
+
 def mod_auto_show(args):
     """
     Show all passwords in all configs
     """
-    all_conn_files = OrderedDict()
-    for connections_path in find_all_connection_paths():
-        connections = Connections(connections_path)
-        all_conn_files[connections_path] = OrderedDict()
-        all_conn_files[connections_path]["connections"] = connections.to_json()
-        all_conn_files[connections_path]["db_system_id"] = connections.prod_prefs.db_system_id
-    return all_conn_files
+    if args.format == "ndjson":
+        return iter_auto_show_records(args)
+    return map_installs(args, auto_show_install, find_all_connection_paths())
+
+
+def iter_connection_attrs(args):
+    """
+    Yields the attributes of each connection given with --jsons then --json-files, "-" being stdin.
+    Files may hold a JSON object, an array of them or NDJSON, and are read as they are consumed.
+    """
+    json_files = [StringIO(json_str) for json_str in args.jsons]
+    json_files += [sys.stdin if json_path == "-" else json_path for json_path in args.json_files or []]
+    record_num = 0
+    for json_file in json_files:
+        if isinstance(json_file, str):
+            json_file = open(json_file)
+        with json_file:
+            for conn_attrs in iter_json_values(json_file):
+                record_num += 1
+                try:
+                    check_connection_attrs(conn_attrs)
+                except Exception as ex:
+                    raise Exception("Connection {}: {}".format(record_num, ex))
+                yield conn_attrs
+
+
+def add_connections(args, connection_attrs_iter):
+    """
+    Adds every connection to every install, reading and encrypting them ADD_BATCH_SIZE at a time with one key
+    derivation per install. Every install is locked while it is loaded and changed, and committed once at the end.
+    Returns the number of connections added and replaced per install.
+    """
+    all_connections = OrderedDict()
+    results = OrderedDict()
+    with ExitStack() as locks:
+        for connections_path in find_all_connection_paths():
+            try:
+                locks.enter_context(install_lock(connections_path))
+                all_connections[connections_path] = Connections(connections_path, streaming=True)
+            except Exception as ex:
+                args.install_errors[connections_path] = "{}: {}".format(type(ex).__name__, ex)
+        if not all_connections and not args.install_errors:
+            raise Exception("Connections path not found, please make at lease one connection in SQLDeveloper")
+        summaries = add_to_all_connections(all_connections, connection_attrs_iter)
+        for connections_path, connections in all_connections.items():
+            try:
+                connections.commit()
+                results[connections_path] = summaries[connections_path]
+            except Exception as ex:
+                args.install_errors[connections_path] = "{}: {}".format(type(ex).__name__, ex)
+    return results
 
 
 def mod_add_connection(args):
@@ -92,6 +301,8 @@ def mod_add_connection(args):
     """
 
     if args.interactive:
+        from getpass import getpass
+
         hostname = ask_default("Enter the hostname of the Oracle SQL server", "localhost")
         port = ask_default("Enter the port", "1521")
         username = ask_default("Enter the username", "system")
@@ -119,44 +330,114 @@ def mod_add_connection(args):
             with open(file_path, "w") as conn_file:
                 json.dump(attrs, conn_file, indent=2)
         if ask_yes_no("Add connection now?", default="y"):
-            for connections_path in find_all_connection_paths():
-                pref_path = find_pref_path(connections_path)
-                prod_pref = ProductPreferences(pref_path)
-                connections = Connections(connections_path)
-                connection = Connection(prod_pref.db_system_id, **attrs)
-                connections.add_connection(connection)
-                connections.save_connections_and_folders(connections_path)
-    else:
-        if args.json_files:
-            for json_path in args.json_files:
-                with open(json_path) as json_file:
-                    json_str = json_file.read()
-                    args.jsons.append(json_str)
-        if args.jsons:
-            connection_attrs_list = []
-            for json_str in args.jsons:
-                conn_attrs_or_list = json.loads(json_str)
-                if isinstance(conn_attrs_or_list, list):
-                    connection_attrs_list += conn_attrs_or_list
-                else:
-                    connection_attrs_list.append(conn_attrs_or_list)
-            all_conn_files = OrderedDict()
-            all_connections_paths = find_all_connection_paths()
-            if len(all_connections_paths) == 0:
-                raise Exception("Connections path not found, please make at lease one connection in SQLDeveloper")
-            for connections_path in all_connections_paths:
-                pref_path = find_pref_path(connections_path)
-                db_system_id = read_db_system_id(pref_path)
-                connections = Connections(connections_path)
-                for conn_attrs in connection_attrs_list:
-                    connection = Connection(db_system_id, **conn_attrs)
-                    connections.add_connection(connection)
-                all_conn_files[connections_path] = connections.to_json()
-                connections.save_connections_and_folders(connections_path)
-            return all_conn_files
-
-
-def parse_args():
+            return add_connections(args, [attrs])
+    elif args.jsons or args.json_files:
+        return add_connections(args, iter_connection_attrs(args))
+
+
+def mod_diff(args):
+    """
+    Compare two connections files, connection by connection
+    """
+    from sqldeveloperconfig.diff import diff_connections, load_connections_file
+
+    loaded = []
+    for connections_path in (args.old_path, args.new_path):
+        try:
+            loaded.append(load_connections_file(connections_path, args.compare_passwords))
+        except Exception as ex:
+            args.install_errors[connections_path] = "{}: {}".format(type(ex).__name__, ex)
+    if args.install_errors:
+        return None
+    return diff_connections(loaded[0], loaded[1], args.compare_passwords, args.jobs if args.jobs > 1 else None)
+
+
+def sync_connections_install(args, connections_path, catalog):
+    from sqldeveloperconfig.sync import sync_install
+
+    return sync_install(connections_path, catalog, args.dry_run)
+
+
+def mod_sync(args):
+    """
+    Merge a catalog of connections into every install, keeping their local changes
+    """
+    from sqldeveloperconfig.sync import read_catalog
+
+    catalog = read_catalog(iter_connection_attrs(args))
+    return map_installs(args, sync_connections_install, find_all_connection_paths(), catalog)
+
+
+def raise_sigterm(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def mod_serve(args):
+    """
+    Serve show, set_passwords and add_connections requests on a Unix socket until interrupted
+    """
+    from sqldeveloperconfig.server import ConnectionsServer, default_socket_path
+
+    socket_path = args.socket or default_socket_path()
+    signal.signal(signal.SIGTERM, raise_sigterm)
+    with ConnectionsServer(socket_path) as server:
+        print(json.dumps({"status": "serving", "socket": socket_path}), flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return OrderedDict([("socket", socket_path), ("requests_served", server.requests_served)])
+
+
+def make_server_request(args):
+    """
+    The request to the server for the module of args, or None if the module runs locally
+    """
+    if args.module == "auto_show":
+        return {"command": "show"}
+    if args.module == "set_passwords":
+        return {"command": "set_passwords", "where": args.where, "match": make_set_passwords_matches(args), "password": args.password, "dry_run": args.dry_run}
+    if args.module in ["add_connection", "add_connections"] and not args.interactive:
+        return {"command": "add_connections", "connections": list(iter_connection_attrs(args))}
+    return None
+
+
+def iter_show_records(result):
+    """
+    The records of auto_show --format ndjson, from the result of a show request
+    """
+    for connections_path, conn_file in result.items():
+        for conn_json in conn_file["connections"].values():
+            record = OrderedDict([("install", connections_path), ("db_system_id", conn_file["db_system_id"])])
+            record.update(conn_json)
+            yield record
+
+
+def run_on_server(args, request):
+    """
+    Sends the request to the server on args.socket, returns its result and adds its errors to args.install_errors
+    """
+    from sqldeveloperconfig.server import send_request
+
+    response = send_request(args.socket, request)
+    if "error" in response:
+        raise Exception("The server failed: {}".format(response["error"]))
+    args.install_errors.update(response.get("errors", {}))
+    if request["command"] == "show" and args.format == "ndjson":
+        return iter_show_records(response["result"])
+    return response["result"]
+
+
+def parse_attr_arg(attr_arg):
+    """
+    Type of the ATTR=VALUE arguments, the query module being only imported when one is given
+    """
+    from sqldeveloperconfig import query
+
+    return query.parse_attr_arg(attr_arg)
+
+
+def parse_args(argv=None):
     main_parser = argparse.ArgumentParser(
         "sqldeveloperpasswords",
         "python3 -m sqldeveloperpasswords",
@@ -164,6 +445,29 @@ def parse_args():
         epilog=EPILOG,
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
+    main_parser.add_argument(
+        "-r",
+        "--root",
+        dest="roots",
+        action="append",
+        help="Directory to search for installs of SQLDeveloper, may be a glob and may be repeated (default: $SQLDEVELOPERCONFIG_ROOTS or ~/.sqldeveloper)",
+    )
+    main_parser.add_argument("--profile", action="store_true", help='Add the time spent per phase to the output, under "timings"')
+    main_parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="Keep the parsed files in a cache and reuse them while the files are unchanged, in the user cache dir. "
+        "Setting $SQLDEVELOPERCONFIG_CACHE_DIR moves the cache there and enables it without --cache",
+    )
+    main_parser.add_argument(
+        "--crypto-backend",
+        help="Library to encrypt and decrypt passwords with, pycryptodomex or cryptography (default: $SQLDEVELOPERCONFIG_CRYPTO_BACKEND, or auto for the fastest installed one)",
+    )
+    main_parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of installs of SQLDeveloper to process at once")
+    main_parser.add_argument(
+        "--socket",
+        help="Unix socket of the serve module. Given to auto_show, set_passwords or add_connection, the request is sent to the server running there",
+    )
     subparsers = main_parser.add_subparsers(help="Module", dest="module")
 
     manual_show_desc = "Decrypt one specific password"
@@ -179,6 +483,12 @@ def parse_args():
 
     auto_desc = "Automatically list and decrypt all passwords in all connections for all installs of SQLDeveloper"
     auto_parser = subparsers.add_parser("auto_show", aliases=["auto"], help=auto_desc, description=auto_desc)
+    auto_parser.add_argument(
+        "--format",
+        choices=["json", "ndjson"],
+        default="json",
+        help="ndjson streams one JSON record per connection, with its install and db_system_id, processing installs one at a time",
+    )
     auto_parser.set_defaults(func=mod_auto_show)
 
     set_passwords_desc = "Automatically set all passwords matching the regex"
@@ -186,32 +496,138 @@ def parse_args():
     set_passwords_parser.add_argument("--name-regex", default=".*", help="Regex to match the connection name")
     set_passwords_parser.add_argument("--user-regex", default=".*", help="Regex to match the user name")
     set_passwords_parser.add_argument("--host-regex", default=".*", help="Regex to match the host name")
+    set_passwords_parser.add_argument(
+        "--where",
+        default=[],
+        action="append",
+        type=parse_attr_arg,
+        metavar="ATTR=VALUE",
+        help="Only connections whose attribute (hostname, port, sid, user, folder, ConnName...) is exactly VALUE, may be repeated",
+    )
+    set_passwords_parser.add_argument(
+        "--match",
+        default=[],
+        action="append",
+        type=parse_attr_arg,
+        metavar="ATTR=REGEX",
+        help="Only connections whose attribute matches REGEX, may be repeated",
+    )
     set_passwords_parser.add_argument("--password", default="", help="New password (if omitted, you will be prompted)")
+    set_passwords_parser.add_argument("--dry-run", action="store_true", help="Only list the connections that match, without changing anything")
     set_passwords_parser.set_defaults(func=mod_set_passwords)
 
+    rekey_desc = "Re-encrypt all saved passwords of all installs, from an old db.system.id to the current (or a new) one"
+    rekey_parser = subparsers.add_parser("rekey", help=rekey_desc, description=rekey_desc)
+    rekey_parser.add_argument("--old-db-system-id", required=True, help="db.system.id the passwords were encrypted with")
+    rekey_parser.add_argument(
+        "--new-db-system-id",
+        help="db.system.id to encrypt the passwords with, also written to product-preferences.xml (default: the one in product-preferences.xml)",
+    )
+    rekey_parser.set_defaults(func=mod_rekey)
+
+    diff_desc = "Compare two connections.xml files, in installs or standalone such as exports: the connections added and removed, and the attributes changed"
+    diff_parser = subparsers.add_parser("diff", help=diff_desc, description=diff_desc)
+    diff_parser.add_argument("old_path", help="connections.xml to compare from")
+    diff_parser.add_argument("new_path", help="connections.xml to compare to")
+    diff_parser.add_argument(
+        "--compare-passwords",
+        action="store_true",
+        help="Compare the decrypted passwords rather than the encrypted ones, which differ between installs with another db.system.id",
+    )
+    diff_parser.set_defaults(func=mod_diff)
+
+    sync_desc = (
+        "Merge a catalog of connections into every install. Attributes the catalog did not change since the last sync keep their local value, "
+        "connections removed from the catalog are removed, and only installs that differ are written"
+    )
+    sync_parser = subparsers.add_parser("sync", help=sync_desc, description=sync_desc)
+    sync_parser.add_argument("--jsons", default=[], nargs="*", type=str, help="Catalog connection(s) as JSON")
+    sync_parser.add_argument("--json-files", nargs="*", type=str, help='Catalog of connections in JSON or NDJSON file(s), "-" for stdin')
+    sync_parser.add_argument("--dry-run", action="store_true", help="Only show what would change, without writing anything")
+    sync_parser.set_defaults(func=mod_sync)
+
+    serve_desc = (
+        "Keep the connections of all installs in memory and answer requests on a Unix socket (--socket, or sqldeveloperconfig.sock in $XDG_RUNTIME_DIR)"
+    )
+    serve_parser = subparsers.add_parser("serve", help=serve_desc, description=serve_desc)
+    serve_parser.set_defaults(func=mod_serve)
+
     add_connection_desc = "Add connection"
     add_connection_parser = subparsers.add_parser("add_connection", aliases=["add_connections"], help=add_connection_desc, description=add_connection_desc)
     add_connection_parser.add_argument("--interactive", action="store_true", help="Add interactively")
     add_connection_parser.add_argument("--jsons", default=[], nargs="*", type=str, help="Add connection(s) with JSON")
-    add_connection_parser.add_argument("--json-files", nargs="*", type=str, help="Add connection(s) from JSON file(s)")
+    add_connection_parser.add_argument(
+        "--json-files", nargs="*", type=str, help='Add connection(s) from JSON or NDJSON file(s), "-" for stdin, streamed so they may be large'
+    )
     add_connection_parser.set_defaults(func=mod_add_connection)
 
-    args = main_parser.parse_args()
+    args = main_parser.parse_args(argv)
+    set_search_roots(args.roots)
+    if args.crypto_backend:
+        from sqldeveloperconfig.crypto_backends import set_crypto_backend
+
+        try:
+            set_crypto_backend(args.crypto_backend)
+        except Exception as ex:
+            main_parser.error(str(ex))
+    if args.cache:
+        from sqldeveloperconfig.cache import set_cache_dir, get_cache_dir, default_cache_dir
+
+        set_cache_dir(get_cache_dir() or default_cache_dir())
     if args.module == "manual":
         args.module = "manual_show"
     elif args.module == "auto":
         args.module = "auto_show"
     elif args.module == "set_passwords":
-        if args.password == "":
+        if args.password == "" and not args.dry_run:
+            from getpass import getpass
+
             args.password = getpass("New password")
     return args
 
 
+def print_ndjson(args, records):
+    """
+    Prints one record per line, flushed as it is made. Stops quietly when the reader goes away, as head does.
+    """
+    try:
+        for record in records:
+            print(json.dumps(record), flush=True)
+        if args.profile:
+            print(json.dumps({"timings": get_timings()}), flush=True)
+    except BrokenPipeError:
+        # Python flushes stdout again at exit, which would fail the same way
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return
+    if args.install_errors:
+        sys.exit(1)
+
+
 def main():
     args = parse_args()
-    result = args.func(args)
-    print(json.dumps({"result": result, "status": "ok"}, indent=2))
+    args.install_errors = OrderedDict()
+    request = make_server_request(args) if args.socket else None
+    if request is None:
+        result = args.func(args)
+    else:
+        result = run_on_server(args, request)
+    if getattr(args, "format", "json") == "ndjson":
+        print_ndjson(args, result)
+        return
+    output = OrderedDict([("result", result), ("status", "ok")])
+    if args.install_errors:
+        output["status"] = "error"
+        output["errors"] = args.install_errors
+    if args.profile:
+        output["timings"] = get_timings()
+    print(json.dumps(output, indent=2))
+    if args.install_errors:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
+    # Run from the module imported under its own name, so the functions sent to workers are pickled by a name that
+    # workers started with spawn or forkserver can import, which this __main__ module is not
+    from sqldeveloperconfig.__main__ import main as run_main
+
+    run_main()
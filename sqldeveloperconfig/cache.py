@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Optional on-disk cache of parsed connections.xml and product-preferences.xml files, enabled by --cache
+"""
+
+import hashlib
+import marshal
+import os
+from os.path import abspath, join, expanduser
+
+from sqldeveloperconfig.profiling import count
+from sqldeveloperconfig.util import atomic_write
+
+# Directory of the cache, which is enabled by setting it
+CACHE_DIR_ENV_VAR = "SQLDEVELOPERCONFIG_CACHE_DIR"
+
+# Bumped when the format of cached data changes, so older entries are ignored
+CACHE_VERSION = 1
+
+_cache_dir = None
+
+
+def default_cache_dir():
+    """
+    The sqldeveloperconfig directory of the user cache dir, $XDG_CACHE_HOME or ~/.cache
+    """
+    return join(os.environ.get("XDG_CACHE_HOME") or expanduser(join("~", ".cache")), "sqldeveloperconfig")
+
+
+def set_cache_dir(cache_dir):
+    """
+    Enables the cache in cache_dir, or with None goes back to $SQLDEVELOPERCONFIG_CACHE_DIR, the cache being disabled when it is unset
+    """
+    global _cache_dir
+    _cache_dir = cache_dir
+
+
+def get_cache_dir():
+    """
+    The directory of the cache, or None when the cache is disabled
+    """
+    return _cache_dir or os.environ.get(CACHE_DIR_ENV_VAR) or None
+
+
+def file_cache_stamp(file_path):
+    """
+    The (mtime, size, inode) of a file, a cache entry for the file is valid while these are unchanged
+    """
+    file_stat = os.stat(file_path)
+    return file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino
+
+
+def cache_entry_path(cache_dir, kind, file_path):
+    entry_name = hashlib.sha1("{}\0{}".format(kind, abspath(file_path)).encode("utf8")).hexdigest()
+    return join(cache_dir, entry_name + ".marshal")
+
+
+def load_cached(kind, file_path, stamp):
+    """
+    Returns the data cached for the kind of parse of a file with this stamp, or None when the cache is disabled, the
+    entry is missing or stale, or it cannot be read
+    """
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return None
+    try:
+        with open(cache_entry_path(cache_dir, kind, file_path), "rb") as entry_file:
+            version, entry_file_path, entry_stamp, data = marshal.load(entry_file)
+    except (OSError, EOFError, ValueError, TypeError):
+        count("cache_misses")
+        return None
+    if version != CACHE_VERSION or entry_file_path != abspath(file_path) or tuple(entry_stamp) != stamp:
+        count("cache_misses")
+        return None
+    count("cache_hits")
+    return data
+
+
+def store_cached(kind, file_path, stamp, data):
+    """
+    Caches data, made only of types marshal supports, for the kind of parse of a file with this stamp.
+    The stamp must be taken before the file is read, so changes made while it is read make the entry stale.
+    Failing to write the cache is not an error, the file is parsed again next time.
+    The cache dir is made private to the user, nothing is cached when it cannot be.
+    """
+    cache_dir = get_cache_dir()
+    if cache_dir is None:
+        return
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        # makedirs leaves the mode of an existing dir as it is
+        os.chmod(cache_dir, 0o700)
+        with atomic_write(cache_entry_path(cache_dir, kind, file_path), "wb") as entry_file:
+            marshal.dump((CACHE_VERSION, abspath(file_path), stamp, data), entry_file)
+    except OSError:
+        return
+    count("cache_writes")
+
+
+def clear_cache():
+    """
+    Removes every entry of the cache
+    """
+    cache_dir = get_cache_dir()
+    if cache_dir is None or not os.path.isdir(cache_dir):
+        return
+    for entry_name in os.listdir(cache_dir):
+        if entry_name.endswith(".marshal"):
+            os.remove(join(cache_dir, entry_name))
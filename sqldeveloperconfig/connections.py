@@ -3,19 +3,58 @@
 Represents the connections.xml file
 """
 
-import xml.etree.ElementTree as ET
+import sys
 from collections import OrderedDict, defaultdict
-from os import makedirs
-from os.path import isfile, isdir, dirname
-from typing import ItemsView
+from collections.abc import ItemsView
+from contextlib import contextmanager
+from itertools import islice
+from types import MappingProxyType
+from os.path import isfile, dirname, join
 
+from sqldeveloperconfig.cache import load_cached, store_cached, file_cache_stamp, get_cache_dir
 from sqldeveloperconfig.constants import XML_DOCTYPE, DEFAULT_CONN_ATTRS
-from sqldeveloperconfig.cryption import decrypt_v4, encrypt_v4
-from sqldeveloperconfig.preferences import find_pref_path, ProductPreferences
-from sqldeveloperconfig.util import to_pretty_xml
+from sqldeveloperconfig.cryption import decrypt_v4, encrypt_v4, decrypt_v4_many, encrypt_v4_many, try_decrypt_v4_many
+from sqldeveloperconfig.lazy import lazy_import
+from sqldeveloperconfig.preferences import find_pref_path, load_product_preferences, forget_product_preferences, file_stamp
+from sqldeveloperconfig.profiling import timed, count
+from sqldeveloperconfig.util import to_pretty_xml, write_pretty_xml, atomic_write, file_lock
+
+ET = lazy_import("xml.etree.ElementTree")
 
 NO_CONNECTIONS_FILE_FOUND_ERROR_MSG = "No connections file found. Please launch SQLDeveloper before running this script for the first time."
 
+# Locked next to connections.xml by every writer of an install, see install_lock
+LOCK_FILE_NAME = "sqldeveloperconfig.lock"
+
+# Marks a password that has not been decrypted yet, since None is a valid password
+UNSET = object()
+
+# Returned by Connections.lookup for a value no connection has, so lookups that miss add nothing to the index
+EMPTY_BUCKET = MappingProxyType(OrderedDict())
+
+# Connections decrypted together when streaming
+DECRYPT_BATCH_SIZE = 256
+
+# Connections read, validated and encrypted together by add_to_all_connections
+ADD_BATCH_SIZE = 256
+
+# Attribute orders already seen, shared by the connections that have them, see attr_layout
+_ATTR_LAYOUTS = {}
+
+# Attributes that Connection.get, Connection.set and Connections.lookup also accept under another name
+ATTR_ALIASES = {"name": "ConnName", "host": "customUrl"}
+
+
+def remove_from_index(index, value, conn_name):
+    """
+    Removes a connection from the bucket of value in an index, dropping the bucket once it is empty
+    """
+    bucket = index.get(value)
+    if bucket is not None:
+        bucket.pop(conn_name, None)
+        if not bucket:
+            del index[value]
+
 
 def make_attr_xml(attr_name, attr_val):
     """
@@ -49,94 +88,371 @@ def make_conn_xml(attrs):
     return ref_elem
 
 
+def make_references_xml():
+    """
+    Template XML for the root of connections.xml, without connections
+    """
+    return ET.Element("References", attrib={"xmlns": "http://xmlns.oracle.com/adf/jndi"})
+
+
+def intern_value(value):
+    """
+    Interns strings, so the many connections sharing a value also share one string
+    """
+    return sys.intern(value) if type(value) is str else value
+
+
+def attr_layout(keys):
+    """
+    Returns the shared {attribute name: default value} of every connection with these attributes in this order.
+    Attributes without a default map to UNSET, their value is always stored by the connection.
+    """
+    layout = _ATTR_LAYOUTS.get(keys)
+    if layout is None:
+        layout = MappingProxyType(OrderedDict((intern_value(key), DEFAULT_CONN_ATTRS.get(key, UNSET)) for key in keys))
+        layout = _ATTR_LAYOUTS.setdefault(keys, layout)
+    return layout
+
+
+def read_conn_attrs_xml(ref_elem):
+    """
+    Returns the (name, value) pairs of the attributes of a <Reference> element, in file order
+    """
+    conn_attrs = []
+    for ref_address_elem in ref_elem.findall("./RefAddresses/StringRefAddr"):
+        conn_attrs.append((ref_address_elem.attrib["addrType"], ref_address_elem.find("./Contents").text))
+    return conn_attrs
+
+
+def iter_connections_xml(connections_file_path, db_system_id):
+    """
+    Yields each Connection of a connections.xml file, freeing each <Reference> element as soon as it is read
+    """
+    for conn_attrs in iter_conn_attrs_xml(connections_file_path):
+        yield Connection(db_system_id, **dict(conn_attrs))
+
+
+def iter_conn_attrs_xml(connections_file_path):
+    """
+    Yields the attribute pairs of each connection of a connections.xml file, see iter_connections_xml
+    """
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(connections_file_path, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 1:
+                if elem.tag == "Reference":
+                    yield read_conn_attrs_xml(elem)
+                root.clear()
+
+
+def decrypt_connections(conns, processes=None):
+    """
+    Decrypts the password of every connection not decrypted yet, in one batch per db_system_id
+    """
+    conns_by_system_id = defaultdict(list)
+    for conn in conns:
+        if not conn.is_decrypted:
+            conns_by_system_id[conn.db_system_id].append(conn)
+    for db_system_id, conns in conns_by_system_id.items():
+        decrypted_list = decrypt_v4_many([conn.encrypted_password for conn in conns], db_system_id, processes)
+        for conn, plaintext_password in zip(conns, decrypted_list):
+            conn._plaintext_password = plaintext_password
+
+
+def check_connection_attrs(conn_attrs):
+    """
+    Raises if conn_attrs is not a JSON object of attribute names to strings or null, as Connection expects
+    """
+    if not isinstance(conn_attrs, dict):
+        raise Exception("Expected a JSON object of connection attributes, got '{}'".format(conn_attrs))
+    for key, value in conn_attrs.items():
+        if value is not None and not isinstance(value, str):
+            raise Exception("Expected a string or null for connection attribute {}, got '{}'".format(key, value))
+
+
+def make_connections(db_system_id, connection_attrs_list):
+    """
+    Makes a Connection of each attribute map, encrypting their plaintext_password in one batch
+    """
+    conns = []
+    plaintext_passwords = []
+    for conn_attrs in connection_attrs_list:
+        conn_attrs = dict(conn_attrs)
+        plaintext_passwords.append(conn_attrs.pop("plaintext_password", UNSET))
+        conns.append(Connection(db_system_id, **conn_attrs))
+    to_encrypt = [(conn, password) for conn, password in zip(conns, plaintext_passwords) if password is not UNSET]
+    encrypted_list = encrypt_v4_many([password for conn, password in to_encrypt], db_system_id)
+    for (conn, plaintext_password), encrypted_password in zip(to_encrypt, encrypted_list):
+        conn.encrypted_password = encrypted_password
+        conn._plaintext_password = plaintext_password
+        conn.modified = False
+    return conns
+
+
+def add_to_all_connections(all_connections, connection_attrs_iter, batch_size=ADD_BATCH_SIZE):
+    """
+    Adds every connection of connection_attrs_iter to every Connections of all_connections, an OrderedDict keyed by
+    connections path, reading and encrypting batch_size of them at a time. Nothing is saved.
+    Returns an OrderedDict of connections path to the number of connections added and replaced.
+    """
+    summaries = OrderedDict((connections_path, OrderedDict([("added", 0), ("replaced", 0)])) for connections_path in all_connections)
+    connection_attrs_iter = iter(connection_attrs_iter)
+    batch = list(islice(connection_attrs_iter, batch_size))
+    while batch:
+        for connections_path, connections in all_connections.items():
+            for connection in make_connections(connections.prod_prefs.db_system_id, batch):
+                summaries[connections_path]["replaced" if connection.name in connections.connections else "added"] += 1
+                connections.add_connection(connection)
+        batch = list(islice(connection_attrs_iter, batch_size))
+    return summaries
+
+
+def install_lock(connections_path, timeout=None):
+    """
+    The advisory lock on the install of a connections.xml, which serializes writers of its connections.xml,
+    product-preferences.xml and sync baseline across processes. Installs are locked independently.
+    """
+    return file_lock(join(dirname(connections_path), LOCK_FILE_NAME), timeout)
+
+
+@contextmanager
+def connections_transaction(connections_path, streaming=True, timeout=None):
+    """
+    Loads a connections.xml under its install lock and yields it as a Connections.transaction, so the files cannot
+    change between loading and committing
+    """
+    with install_lock(connections_path, timeout):
+        connections = Connections(connections_path, streaming)
+        with connections.transaction(timeout):
+            yield connections
+
+
+def iter_decrypted_connections(connections_file_path, batch_size=DECRYPT_BATCH_SIZE):
+    """
+    Yields each Connection of a connections.xml file with its folder set and its password decrypted.
+    At most batch_size connections are held at once, so memory does not grow with the file.
+    """
+    prod_prefs = load_product_preferences(find_pref_path(connections_file_path))
+    batch = []
+    for conn in iter_connections_xml(connections_file_path, prod_prefs.db_system_id):
+        conn.folder = prod_prefs.find_connection_dir(conn.name, conn.folder)
+        batch.append(conn)
+        if len(batch) >= batch_size:
+            decrypt_connections(batch)
+            yield from batch
+            batch = []
+    decrypt_connections(batch)
+    yield from batch
+
+
 class Connection:
     """
-    Represents a single connection in SQLDeveloper
+    Represents a single connection in SQLDeveloper.
+    Attribute order is a layout shared by every connection with the same attributes, only values that differ from
+    DEFAULT_CONN_ATTRS are stored per connection, and names and values are interned.
     """
 
+    __slots__ = ("db_system_id", "_plaintext_password", "_owner", "_folder", "_layout", "_overrides", "modified")
+
     def __init__(self, db_system_id, **kwattrs):
-        self.db_system_id = db_system_id
-        self._attrs = OrderedDict()
-        self._attrs.update(kwattrs)
-        for key in DEFAULT_CONN_ATTRS:
-            if key not in self._attrs:
-                self._attrs[key] = DEFAULT_CONN_ATTRS[key]
-        if "plaintext_password" in self._attrs:
-            plaintext_password = self._attrs.pop("plaintext_password")
+        self.db_system_id = intern_value(db_system_id)
+        self._plaintext_password = UNSET
+        # The Connections holding this connection, told about attribute changes to keep its indexes current
+        self._owner = None
+        self._folder = ""
+        plaintext_password = kwattrs.pop("plaintext_password", UNSET)
+        folder = kwattrs.pop("folder", "")
+        keys = list(kwattrs)
+        keys.extend(key for key in DEFAULT_CONN_ATTRS if key not in kwattrs and key != "folder")
+        self._layout = attr_layout(tuple(keys))
+        self._overrides = {}
+        for key, value in kwattrs.items():
+            self._store(key, value)
+        if plaintext_password is not UNSET:
             self.plaintext_password = plaintext_password
-        if "folder" in self._attrs:
-            self.folder = self._attrs.pop("folder")
-        else:
-            self.folder = ""
+        self.folder = folder
+        # Set by the attribute setters, folder changes are tracked by Connections
+        self.modified = False
 
     @property
     def name(self):
-        return self._attrs["ConnName"]
+        return self.get("ConnName")
 
     @name.setter
     def name(self, new_value):
-        self._attrs["ConnName"] = new_value
+        self.set("ConnName", new_value)
 
     @property
     def user(self):
-        return self._attrs["user"]
+        return self.get("user")
 
     @user.setter
     def user(self, new_value):
-        self._attrs["user"] = new_value
+        self.set("user", new_value)
 
     @property
     def encrypted_password(self):
-        return self._attrs.get("password", None)
+        return self.get("password")
 
     @encrypted_password.setter
     def encrypted_password(self, new_value):
         if isinstance(new_value, (bytes, bytearray)):
-            self._attrs["password"] = new_value.decode("utf8")
-        else:
-            self._attrs["password"] = new_value
-        self._attrs["SavePassword"] = "true"
+            new_value = new_value.decode("utf8")
+        self.set("password", new_value)
+        self.set("SavePassword", "true")
+        self._plaintext_password = UNSET
 
     @property
     def plaintext_password(self):
-        if self.encrypted_password is None:
-            return None
-        return decrypt_v4(self.encrypted_password, self.db_system_id)
+        """
+        Decrypted on first access, then cached until the password is set again
+        """
+        if self._plaintext_password is UNSET:
+            if self.encrypted_password is None:
+                self._plaintext_password = None
+            else:
+                self._plaintext_password = decrypt_v4(self.encrypted_password, self.db_system_id)
+        return self._plaintext_password
 
     @plaintext_password.setter
     def plaintext_password(self, new_password):
         self.encrypted_password = encrypt_v4(new_password, self.db_system_id)
+        self._plaintext_password = new_password
+
+    @property
+    def is_decrypted(self):
+        return self._plaintext_password is not UNSET
 
     @property
     def host(self):
-        return self._attrs["customUrl"]
+        return self.get("customUrl")
 
     @host.setter
     def host(self, new_value):
-        self._attrs["customUrl"] = new_value
+        self.set("customUrl", new_value)
+
+    @property
+    def folder(self):
+        return self._folder
+
+    @folder.setter
+    def folder(self, new_value):
+        old_value = self._folder
+        self._folder = new_value
+        if self._owner is not None:
+            self._owner._reindex(self, "folder", old_value, new_value)
+
+    def get(self, key, default=None):
+        """
+        Returns an attribute by name, or the folder, name (ConnName) or host (customUrl)
+        """
+        return self.get_attr(ATTR_ALIASES.get(key, key), default)
+
+    def get_attr(self, key, default=None):
+        """
+        Returns an attribute, or the folder, by its name in the file, so "name" and "host" are attributes of their own
+        """
+        if key == "folder":
+            return self._folder
+        value = self._overrides.get(key, UNSET)
+        if value is UNSET:
+            value = self._layout.get(key, UNSET)
+            if value is UNSET:
+                return default
+        return value
+
+    def set(self, key, new_value):
+        """
+        Sets an attribute by name, or the folder, name (ConnName) or host (customUrl)
+        """
+        self.set_attr(ATTR_ALIASES.get(key, key), new_value)
+
+    def set_attr(self, key, new_value):
+        """
+        Sets an attribute, or the folder, by its name in the file, so "name" and "host" are attributes of their own
+        """
+        if key == "folder":
+            self.folder = new_value
+            return
+        if key == "ConnName" and self._owner is not None:
+            self._owner._check_rename(self, new_value)
+        old_value = self.get_attr(key)
+        if key not in self._layout:
+            self._layout = attr_layout(tuple(self._layout) + (key,))
+        self._store(key, new_value)
+        if key == "password":
+            self._plaintext_password = UNSET
+        self.modified = True
+        if self._owner is not None:
+            self._owner._reindex(self, key, old_value, new_value)
+
+    def _store(self, key, value):
+        if key in DEFAULT_CONN_ATTRS and value == DEFAULT_CONN_ATTRS[key]:
+            self._overrides.pop(key, None)
+        elif key == "password":
+            self._overrides["password"] = value
+        else:
+            self._overrides[intern_value(key)] = intern_value(value)
+
+    def attrs(self):
+        """
+        Returns every attribute, defaults included, in file order
+        """
+        overrides = self._overrides
+        return OrderedDict((key, overrides.get(key, default)) for key, default in self._layout.items())
+
+    def diff(self, other, compare_passwords=False):
+        """
+        Returns the attributes, folder included, that only this connection has, those only other has, and
+        {name: (value, other value)} of those whose values differ. Attribute order does not matter.
+        With compare_passwords, plaintext_password is compared instead of the encrypted password.
+        """
+        if (
+            self._layout is other._layout
+            and self._folder == other._folder
+            and self._overrides == other._overrides
+            and (not compare_passwords or self.db_system_id == other.db_system_id)
+        ):
+            return OrderedDict(), OrderedDict(), OrderedDict()
+        attrs = self.attrs()
+        other_attrs = other.attrs()
+        if compare_passwords:
+            attrs.pop("password", None)
+            other_attrs.pop("password", None)
+        only_self = OrderedDict((key, value) for key, value in attrs.items() if key not in other_attrs)
+        only_other = OrderedDict((key, value) for key, value in other_attrs.items() if key not in attrs)
+        different = OrderedDict()
+        if self.folder != other.folder:
+            different["folder"] = (self.folder, other.folder)
+        if compare_passwords and self.plaintext_password != other.plaintext_password:
+            different["plaintext_password"] = (self.plaintext_password, other.plaintext_password)
+        for key, value in attrs.items():
+            if key in other_attrs and other_attrs[key] != value:
+                different[key] = (value, other_attrs[key])
+        return only_self, only_other, different
 
     def to_json(self):
         json_dict = OrderedDict()
         json_dict["folder"] = self.folder
         json_dict["plaintext_password"] = self.plaintext_password
-        json_dict.update(self._attrs)
+        json_dict.update(self.attrs())
         return json_dict
 
     def to_xml_elem(self):
-        return make_conn_xml(self._attrs)
+        return make_conn_xml(self.attrs())
 
     def to_xml(self):
         return to_pretty_xml(self.to_xml_elem())
 
     @classmethod
     def from_xml(cls, db_system_id, xml_ref_entry):
-        conn_info = OrderedDict()
-        for ref_address_entry in xml_ref_entry.findall("./RefAddresses/StringRefAddr"):
-            key = ref_address_entry.attrib["addrType"]
-            value_elem = ref_address_entry.find("./Contents")
-            value = value_elem.text
-            conn_info[key] = value
-        return Connection(db_system_id, **conn_info)
+        return Connection(db_system_id, **dict(read_conn_attrs_xml(xml_ref_entry)))
 
 
 class Connections:
@@ -144,46 +460,201 @@ class Connections:
     Represents a connections file in SQLDeveloper
     """
 
-    def __init__(self, connections_file_path):
+    def __init__(self, connections_file_path, streaming=False):
+        """
+        With streaming, the file is read with iterparse and no tree is kept, so self.tree and self.root are None.
+        They are None too when the connections come from the parse cache, which is used when enabled and current.
+        """
         self.connections = OrderedDict()
+        # Attribute name to {attribute value: {connection name: connection}}, created by create_index
+        self._indexes = {}
+        self.file_path = connections_file_path
+        self._streaming = streaming
+        self._modified = False
         pref_path = find_pref_path(connections_file_path)
-        self.prod_prefs = ProductPreferences(pref_path)
+        self.prod_prefs = load_product_preferences(pref_path)
         db_system_id = self.prod_prefs.db_system_id
 
         if not isfile(connections_file_path):
-            self.save_connections(connections_file_path)
-        self.tree = ET.parse(connections_file_path)
-        self.root = self.tree.getroot()
-        for ref_entry in self.root.findall("./Reference"):
-            conn = Connection.from_xml(db_system_id, ref_entry)
-            self.add_connection(conn)
-        for dir_name, conn_names in self.prod_prefs.load_all_connection_dirs().items():
-            for conn_name in conn_names:
-                if conn_name in self.connections:
-                    self.connections[conn_name].folder = dir_name
+            self.save_connections(connections_file_path, force=True)
+        cache_stamp = file_cache_stamp(connections_file_path)
+        # Taken before reading, so a write during loading is seen as a conflict by check_unchanged
+        self.stamp = cache_stamp
+        cached = load_cached("connections", connections_file_path, cache_stamp)
+        to_cache = [] if cached is None and get_cache_dir() is not None else None
+        self.tree = None
+        self.root = None
+        with timed("connections_parse"):
+            if cached is not None:
+                conn_attrs_iter = cached
+            elif streaming:
+                conn_attrs_iter = iter_conn_attrs_xml(connections_file_path)
+            else:
+                self.tree = ET.parse(connections_file_path)
+                self.root = self.tree.getroot()
+                conn_attrs_iter = (read_conn_attrs_xml(ref_entry) for ref_entry in self.root.findall("./Reference"))
+            for conn_attrs in conn_attrs_iter:
+                if to_cache is not None:
+                    to_cache.append(conn_attrs)
+                self.add_connection(Connection(db_system_id, **dict(conn_attrs)))
+        count("connections_loaded", len(self.connections))
+        if to_cache is not None:
+            store_cached("connections", connections_file_path, cache_stamp, to_cache)
+        for conn_name, conn in self.connections.items():
+            conn.folder = self.prod_prefs.find_connection_dir(conn_name, conn.folder)
+        self._mark_saved()
+        self._mark_folders_saved()
 
     def __iter__(self):
         return self.connections.keys()
 
-    def items(self) -> ItemsView[str, Connection]:
+    def items(self) -> "ItemsView[str, Connection]":
         return self.connections.items()
 
     def add_connection(self, connection):
         if connection.name in self.connections:
             old_conn = self.connections[connection.name]
-            if connection.plaintext_password == "":
+            # Only "" encrypts to "", so this avoids decrypting
+            if connection.encrypted_password == "":
                 connection.encrypted_password = old_conn.encrypted_password
+            self._unindex(old_conn)
+            old_conn._owner = None
         self.connections[connection.name] = connection
+        connection._owner = self
+        for attr, index in self._indexes.items():
+            index.setdefault(connection.get(attr), OrderedDict())[connection.name] = connection
+        self._modified = True
 
     def pop_connection(self, connection_name):
-        return self.connections.pop(connection_name)
+        connection = self.connections.pop(connection_name)
+        self._unindex(connection)
+        connection._owner = None
+        self._modified = True
+        return connection
+
+    def create_index(self, attr):
+        """
+        Indexes the connections by an attribute, the index is then kept current as connections change
+        """
+        attr = ATTR_ALIASES.get(attr, attr)
+        if attr not in self._indexes:
+            index = {}
+            for conn_name, conn in self.connections.items():
+                index.setdefault(conn.get(attr), OrderedDict())[conn_name] = conn
+            self._indexes[attr] = index
+
+    def lookup(self, attr, value):
+        """
+        Returns a read-only view of {connection name: connection} for the connections whose attribute equals value,
+        which follows changes to them until none is left. The attribute is indexed on first lookup.
+        """
+        attr = ATTR_ALIASES.get(attr, attr)
+        self.create_index(attr)
+        bucket = self._indexes[attr].get(value)
+        return EMPTY_BUCKET if bucket is None else MappingProxyType(bucket)
+
+    def _unindex(self, conn):
+        for attr, index in self._indexes.items():
+            remove_from_index(index, conn.get(attr), conn.name)
+
+    def _check_rename(self, conn, new_name):
+        if new_name in self.connections and self.connections[new_name] is not conn:
+            raise Exception("Cannot rename '{}', a connection named '{}' already exists".format(conn.name, new_name))
+
+    def _reindex(self, conn, attr, old_value, new_value):
+        """
+        Called by a Connection after one of its attributes changed
+        """
+        if attr == "ConnName":
+            # Renamed in place, keeping file order: only the connections after it are moved back behind it
+            connections = self.connections
+            following = list(connections)
+            following = following[following.index(old_value) + 1 :]
+            connections[new_value] = connections.pop(old_value)
+            for conn_name in following:
+                connections.move_to_end(conn_name)
+            for index_attr, index in self._indexes.items():
+                if index_attr == "ConnName":
+                    remove_from_index(index, old_value, old_value)
+                    index.setdefault(new_value, OrderedDict())[new_value] = conn
+                else:
+                    bucket = index[conn.get(index_attr)]
+                    bucket.pop(old_value, None)
+                    bucket[new_value] = conn
+        elif attr in self._indexes:
+            index = self._indexes[attr]
+            remove_from_index(index, old_value, conn.name)
+            index.setdefault(new_value, OrderedDict())[conn.name] = conn
 
-    def to_json(self):
-        all_conns_dict = OrderedDict([(conn_name, conn.to_json()) for conn_name, conn in self.connections.items()])
+    @property
+    def is_modified(self):
+        """
+        True when a connection was added, removed or changed since loading or the last save
+        """
+        return self._modified or any(conn.modified for conn in self.connections.values())
+
+    @property
+    def folders_modified(self):
+        """
+        True when folder membership changed since loading or the last save
+        """
+        return self._conn_folders() != self._saved_conn_folders
+
+    def _conn_folders(self):
+        return {conn_name: conn.folder for conn_name, conn in self.connections.items() if conn.folder}
+
+    def _mark_saved(self):
+        self._modified = False
+        for conn in self.connections.values():
+            conn.modified = False
+
+    def _mark_folders_saved(self):
+        self._saved_conn_folders = self._conn_folders()
+
+    def decrypt_all(self, processes=None):
+        """
+        Decrypts every password that has not been decrypted yet, in one batch per db_system_id
+        """
+        decrypt_connections(self.connections.values(), processes)
+
+    def rekey(self, old_db_system_id, new_db_system_id=None, processes=None):
+        """
+        Re-encrypts every saved password from old_db_system_id to new_db_system_id, by default the db.system.id of
+        product-preferences.xml, which is set to new_db_system_id otherwise. Each key is derived once for the batch.
+        Passwords already encrypted with new_db_system_id are left alone, so an interrupted rekey can be run again.
+        Raises, changing nothing, if a password was encrypted with neither. Returns the number of passwords re-encrypted.
+        """
+        if new_db_system_id is None:
+            new_db_system_id = self.prod_prefs.db_system_id
+        conns = [conn for conn in self.connections.values() if conn.encrypted_password]
+        encrypted_list = [conn.encrypted_password for conn in conns]
+        old_plaintext_list = try_decrypt_v4_many(encrypted_list, old_db_system_id, processes)
+        new_plaintext_list = try_decrypt_v4_many(encrypted_list, new_db_system_id, processes)
+        to_rekey = []
+        for conn, old_plaintext, new_plaintext in zip(conns, old_plaintext_list, new_plaintext_list):
+            if new_plaintext is not None and (old_plaintext is None or new_db_system_id == old_db_system_id):
+                continue
+            if old_plaintext is None:
+                raise Exception("The password of '{}' was encrypted with neither db.system.id".format(conn.name))
+            to_rekey.append((conn, old_plaintext))
+        plaintext_list = [plaintext for conn, plaintext in to_rekey]
+        for (conn, plaintext), encrypted in zip(to_rekey, encrypt_v4_many(plaintext_list, new_db_system_id, processes)):
+            conn.set("password", encrypted)
+            conn._plaintext_password = plaintext
+        for conn in self.connections.values():
+            conn.db_system_id = intern_value(new_db_system_id)
+        if self.prod_prefs.db_system_id != new_db_system_id:
+            self.prod_prefs.db_system_id = new_db_system_id
+        return len(to_rekey)
+
+    def to_json(self, processes=None):
+        self.decrypt_all(processes)
+        with timed("serialization"):
+            all_conns_dict = OrderedDict([(conn_name, conn.to_json()) for conn_name, conn in self.connections.items()])
         return all_conns_dict
 
     def to_xml_elem(self):
-        references_elem = ET.Element("References", attrib={"xmlns": "http://xmlns.oracle.com/adf/jndi"})
+        references_elem = make_references_xml()
         for conn_name, conn in self.items():
             references_elem.append(conn.to_xml_elem())
         return references_elem
@@ -194,23 +665,107 @@ class Connections:
     def to_xml_doc(self):
         return XML_DOCTYPE + to_pretty_xml(self.to_xml_elem())
 
-    def save_folders(self):
+    def save_folders(self, force=False):
+        """
+        Writes the folders to product-preferences.xml, unless folder membership is unchanged. Returns True if written.
+        """
+        if not force and not self.folders_modified:
+            return False
         connection_dirs = defaultdict(list)
         for conn_name, conn in self.items():
             if conn.folder:
                 connection_dirs[conn.folder].append(conn_name)
         self.prod_prefs.update_all_connection_dirs(connection_dirs)
         self.prod_prefs.save_xml()
-
-    def save_connections(self, connections_path):
-        pretty_xml = self.to_xml_doc()
-        with open(connections_path, "w") as redone_file:
-            redone_file.write(pretty_xml)
-
-    def save_connections_and_folders(self, connections_path):
-        self.save_connections(connections_path)
-        self.save_folders()
+        self._mark_folders_saved()
+        return True
+
+    def save_connections(self, connections_path, force=False):
+        """
+        Writes connections.xml, unless it is the loaded file and nothing changed. Returns True if written.
+        """
+        if not force and connections_path == self.file_path and not self.is_modified:
+            return False
+        # Each connection is made into XML as it is written, so the whole tree is never held
+        with timed("write"), atomic_write(connections_path) as redone_file:
+            redone_file.write(XML_DOCTYPE)
+            write_pretty_xml(make_references_xml(), redone_file, (conn.to_xml_elem() for conn in self.connections.values()))
+        count("files_written")
+        if connections_path == self.file_path:
+            self.stamp = file_cache_stamp(connections_path)
+            self._mark_saved()
+        return True
+
+    def save_connections_and_folders(self, connections_path, force=False):
+        connections_saved = self.save_connections(connections_path, force)
+        folders_saved = self.save_folders(force)
+        return connections_saved or folders_saved
+
+    def set_passwords(self, plaintext_passwords):
+        """
+        Sets the password of each connection named in plaintext_passwords, a mapping of name to plaintext password,
+        encrypting them in one batch per db.system.id
+        """
+        to_encrypt = defaultdict(list)
+        for conn_name, plaintext_password in plaintext_passwords.items():
+            if conn_name not in self.connections:
+                raise Exception("No connection named '{}'".format(conn_name))
+            conn = self.connections[conn_name]
+            to_encrypt[conn.db_system_id].append((conn, plaintext_password))
+        for db_system_id, conn_passwords in to_encrypt.items():
+            encrypted_list = encrypt_v4_many([plaintext_password for conn, plaintext_password in conn_passwords], db_system_id)
+            for (conn, plaintext_password), encrypted_password in zip(conn_passwords, encrypted_list):
+                conn.encrypted_password = encrypted_password
+                conn._plaintext_password = plaintext_password
+
+    def check_unchanged(self):
+        """
+        Raises if connections.xml or product-preferences.xml was written by another writer since they were loaded or saved
+        """
+        for file_path, stamp, stamp_fn in ((self.file_path, self.stamp, file_cache_stamp), (self.prod_prefs.file_path, self.prod_prefs.stamp, file_stamp)):
+            if not isfile(file_path) or stamp_fn(file_path) != stamp:
+                raise Exception("{} changed since it was loaded, load it again and retry".format(file_path))
+
+    def reload(self):
+        """
+        Discards every unsaved change, to product-preferences.xml too, by loading the files again
+        """
+        if self.prod_prefs.modified:
+            forget_product_preferences(self.prod_prefs.file_path)
+        for conn in self.connections.values():
+            conn._owner = None
+        self.__init__(self.file_path, self._streaming)
+
+    def commit(self, timeout=None):
+        """
+        Under the install lock, checks that neither file changed since loading, then writes connections.xml if it
+        changed, and product-preferences.xml if the folders or the db.system.id changed. Each file is replaced
+        atomically, and the lock keeps other writers out until both are. Raises, writing nothing, on a conflict.
+        Returns True if a file was written.
+        """
+        with install_lock(self.file_path, timeout):
+            self.check_unchanged()
+            connections_saved = self.save_connections(self.file_path)
+            folders_saved = self.save_folders()
+            prefs_saved = self.prod_prefs.save_xml()
+        return connections_saved or folders_saved or prefs_saved
+
+    @contextmanager
+    def transaction(self, timeout=None):
+        """
+        Holds the install lock for the with block, in which any number of connections may be added, popped or changed,
+        then commits them. Raises on entering if the files changed since loading. An error in the block discards every
+        unsaved change, by loading the files again, and nothing is written.
+        """
+        with install_lock(self.file_path, timeout):
+            self.check_unchanged()
+            try:
+                yield self
+            except BaseException:
+                self.reload()
+                raise
+            self.commit()
 
     @classmethod
-    def from_connections_file_path(cls, connections_file_path):
-        return Connections(connections_file_path)
+    def from_connections_file_path(cls, connections_file_path, streaming=False):
+        return Connections(connections_file_path, streaming)
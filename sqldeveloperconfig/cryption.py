@@ -4,13 +4,34 @@ For encryption and decryption of SQLDeveloper passwords
 """
 
 import base64
-import hashlib
+from functools import lru_cache
+from itertools import repeat
 
-from Cryptodome.Cipher import DES
+from sqldeveloperconfig.lazy import lazy_import
+from sqldeveloperconfig.profiling import timed, count
+
+crypto_backends = lazy_import("sqldeveloperconfig.crypto_backends")
+futures = lazy_import("concurrent.futures")
+
+DES_BLOCK_SIZE = 8
+
+# Batches larger than this are split into chunks of this size when a process pool is requested
+BATCH_CHUNK_SIZE = 10000
+
+# Number of distinct db.system.id keys kept in memory, one per install is typical
+V4_KEY_CACHE_SIZE = 128
 
 
 def generate_cipher(decryption_key, iv):
-    return DES.new(decryption_key, DES.MODE_CBC, iv)
+    return crypto_backends.get_crypto_backend().new_cbc(decryption_key, iv)
+
+
+def generate_ecb_cipher(decryption_key):
+    return crypto_backends.get_crypto_backend().new_ecb(decryption_key)
+
+
+def xor_bytes(left, right):
+    return (int.from_bytes(left, "big") ^ int.from_bytes(right, "big")).to_bytes(len(left), "big")
 
 
 def pad(unpadded_str):
@@ -39,16 +60,66 @@ def des_cbc_encrypt(plaintext_password, decryption_key, iv):
     return encrypted_password_bytes
 
 
-def v4_salt_iv(db_system_id):
+def des_cbc_decrypt_many(encrypted_passwords, decryption_key, iv):
+    """
+    Decrypts many DES-CBC messages sharing a key and IV in a single ECB pass.
+    In CBC each plaintext block is the decrypted block XORed with the previous ciphertext block (or the IV),
+    so all messages can be decrypted at once and the chaining applied to the whole buffer.
+    """
+    for encrypted_password in encrypted_passwords:
+        if len(encrypted_password) % DES_BLOCK_SIZE != 0:
+            raise ValueError("Data must be aligned to block boundary in CBC mode")
+    ciphertext = b"".join(encrypted_passwords)
+    chain = b"".join([iv + encrypted_password[:-DES_BLOCK_SIZE] for encrypted_password in encrypted_passwords])
+    decrypted = xor_bytes(generate_ecb_cipher(decryption_key).decrypt(ciphertext), chain)
+    decrypted_passwords = []
+    offset = 0
+    for encrypted_password in encrypted_passwords:
+        end = offset + len(encrypted_password)
+        decrypted_passwords.append(unpad(decrypted[offset:end]))
+        offset = end
+    return decrypted_passwords
 
+
+def des_cbc_encrypt_many(plaintext_passwords, decryption_key, iv):
+    """
+    Encrypts many DES-CBC messages sharing a key and IV, one ECB pass per block position.
+    CBC encryption is sequential within a message, but the n-th blocks of all messages are independent.
+    """
+    padded_passwords = [pad(plaintext_password) for plaintext_password in plaintext_passwords]
+    encrypted_passwords = [bytearray() for _ in padded_passwords]
+    previous_blocks = [iv for _ in padded_passwords]
+    ecb_cipher = generate_ecb_cipher(decryption_key)
+    active = list(range(len(padded_passwords)))
+    offset = 0
+    while active:
+        plain_blocks = b"".join([padded_passwords[i][offset : offset + DES_BLOCK_SIZE] for i in active])
+        chain = b"".join([previous_blocks[i] for i in active])
+        encrypted_blocks = ecb_cipher.encrypt(xor_bytes(plain_blocks, chain))
+        for block_num, i in enumerate(active):
+            encrypted_block = encrypted_blocks[block_num * DES_BLOCK_SIZE : (block_num + 1) * DES_BLOCK_SIZE]
+            encrypted_passwords[i] += encrypted_block
+            previous_blocks[i] = encrypted_block
+        offset += DES_BLOCK_SIZE
+        active = [i for i in active if len(padded_passwords[i]) > offset]
+    return [bytes(encrypted_password) for encrypted_password in encrypted_passwords]
+
+
+@lru_cache(maxsize=V4_KEY_CACHE_SIZE)
+def v4_salt_iv(db_system_id):
+    """
+    Derives the DES key and IV from the db.system.id, memoized since the derivation is 42 rounds of MD5
+    """
     salt = bytes.fromhex("051399429372e8ad")
     num_iteration = 42
 
     # key generation from a machine-unique value with a fixed salt
-    key = bytes(db_system_id, "utf8") + salt
-    for i in range(num_iteration):
-        m = hashlib.md5(key)
-        key = m.digest()
+    md5 = crypto_backends.get_crypto_backend().md5
+    with timed("key_derivation"):
+        key = bytes(db_system_id, "utf8") + salt
+        for i in range(num_iteration):
+            key = md5(key)
+    count("key_derivation")
 
     secret_key = key[:8]
     iv = key[8:]
@@ -59,8 +130,10 @@ def decrypt_v4(encrypted, db_system_id):
     if encrypted == "":
         return ""
     secret_key, iv = v4_salt_iv(db_system_id)
-    encrypted_password = base64.b64decode(encrypted)
-    decrypted = des_cbc_decrypt(encrypted_password, secret_key, iv)
+    with timed("decrypt"):
+        encrypted_password = base64.b64decode(encrypted)
+        decrypted = des_cbc_decrypt(encrypted_password, secret_key, iv)
+    count("decrypt")
     return decrypted.decode("utf8")
 
 
@@ -68,6 +141,119 @@ def encrypt_v4(plain_pass, db_system_id):
     if plain_pass == "":
         return ""
     secret_key, iv = v4_salt_iv(db_system_id)
-    encrypted_bytes = des_cbc_encrypt(plain_pass, secret_key, iv)
-    encrypted_password = base64.b64encode(encrypted_bytes)
+    with timed("encrypt"):
+        encrypted_bytes = des_cbc_encrypt(plain_pass, secret_key, iv)
+        encrypted_password = base64.b64encode(encrypted_bytes)
+    count("encrypt")
     return encrypted_password.decode("utf8")
+
+
+def _map_batch(batch_fn, values, db_system_id, processes):
+    """
+    Calls batch_fn on the whole batch, or on chunks of it spread across a process pool
+    """
+    if not processes or len(values) <= BATCH_CHUNK_SIZE:
+        return batch_fn(values, db_system_id)
+    chunks = [values[start : start + BATCH_CHUNK_SIZE] for start in range(0, len(values), BATCH_CHUNK_SIZE)]
+    results = []
+    with futures.ProcessPoolExecutor(processes) as executor:
+        for chunk_result in executor.map(batch_fn, chunks, repeat(db_system_id)):
+            results += chunk_result
+    return results
+
+
+def _decrypt_v4_batch(encrypted_list, db_system_id):
+    decrypted_list = [encrypted if encrypted is None or encrypted == "" else None for encrypted in encrypted_list]
+    to_decrypt = [i for i, encrypted in enumerate(encrypted_list) if encrypted]
+    if not to_decrypt:
+        return decrypted_list
+    secret_key, iv = v4_salt_iv(db_system_id)
+    with timed("decrypt"):
+        encrypted_passwords = [base64.b64decode(encrypted_list[i]) for i in to_decrypt]
+        for i, decrypted in zip(to_decrypt, des_cbc_decrypt_many(encrypted_passwords, secret_key, iv)):
+            decrypted_list[i] = decrypted.decode("utf8")
+    count("decrypt", len(to_decrypt))
+    return decrypted_list
+
+
+def _encrypt_v4_batch(plain_list, db_system_id):
+    encrypted_list = [plain if plain is None or plain == "" else None for plain in plain_list]
+    to_encrypt = [i for i, plain in enumerate(plain_list) if plain]
+    if not to_encrypt:
+        return encrypted_list
+    secret_key, iv = v4_salt_iv(db_system_id)
+    with timed("encrypt"):
+        encrypted_passwords = des_cbc_encrypt_many([plain_list[i] for i in to_encrypt], secret_key, iv)
+        for i, encrypted_bytes in zip(to_encrypt, encrypted_passwords):
+            encrypted_list[i] = base64.b64encode(encrypted_bytes).decode("utf8")
+    count("encrypt", len(to_encrypt))
+    return encrypted_list
+
+
+def decrypt_v4_many(encrypted_list, db_system_id, processes=None):
+    """
+    Decrypts a batch of v4 passwords, deriving the key once, or not at all when there is nothing to decrypt. None and "" are passed through unchanged.
+    With processes, batches larger than BATCH_CHUNK_SIZE are split across a process pool.
+    """
+    return _map_batch(_decrypt_v4_batch, list(encrypted_list), db_system_id, processes)
+
+
+def encrypt_v4_many(plain_list, db_system_id, processes=None):
+    """
+    Encrypts a batch of v4 passwords, deriving the key once, or not at all when there is nothing to encrypt. None and "" are passed through unchanged.
+    With processes, batches larger than BATCH_CHUNK_SIZE are split across a process pool.
+    """
+    return _map_batch(_encrypt_v4_batch, list(plain_list), db_system_id, processes)
+
+
+def _try_decrypt_v4_batch(encrypted_list, db_system_id):
+    secret_key, iv = v4_salt_iv(db_system_id)
+    decrypted_list = [None for _ in encrypted_list]
+    to_decrypt = []
+    encrypted_passwords = []
+    for i, encrypted in enumerate(encrypted_list):
+        try:
+            encrypted_bytes = base64.b64decode(encrypted, validate=True)
+        except (TypeError, ValueError):
+            continue
+        if encrypted_bytes and len(encrypted_bytes) % DES_BLOCK_SIZE == 0:
+            to_decrypt.append(i)
+            encrypted_passwords.append(encrypted_bytes)
+    with timed("decrypt"):
+        decrypted_passwords = des_cbc_decrypt_many(encrypted_passwords, secret_key, iv)
+    count("decrypt", len(to_decrypt))
+    checked = []
+    for i, encrypted_bytes, decrypted in zip(to_decrypt, encrypted_passwords, decrypted_passwords):
+        try:
+            checked.append((i, encrypted_bytes, decrypted.decode("utf8")))
+        except UnicodeDecodeError:
+            pass
+    with timed("encrypt"):
+        encrypted_again = des_cbc_encrypt_many([plain for i, encrypted_bytes, plain in checked], secret_key, iv)
+    count("encrypt", len(checked))
+    for (i, encrypted_bytes, plain), encrypted_again_bytes in zip(checked, encrypted_again):
+        if encrypted_again_bytes == encrypted_bytes:
+            decrypted_list[i] = plain
+    return decrypted_list
+
+
+def try_decrypt_v4_many(encrypted_list, db_system_id, processes=None):
+    """
+    Decrypts a batch of v4 passwords like decrypt_v4_many, but a password that was not encrypted with db_system_id
+    comes back as None rather than as garbage or an error. Each one is checked by encrypting it again.
+    """
+    return _map_batch(_try_decrypt_v4_batch, list(encrypted_list), db_system_id, processes)
+
+
+def v4_key_cache_info():
+    """
+    Returns the hits, misses, maxsize and currsize of the v4 key cache
+    """
+    return v4_salt_iv.cache_info()
+
+
+def clear_v4_key_cache():
+    """
+    Evicts every derived key from the v4 key cache
+    """
+    v4_salt_iv.cache_clear()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+The DES and MD5 primitives the passwords are encrypted with, provided by one of several libraries.
+The fastest installed backend is picked at first use, unless one is chosen with set_crypto_backend or $SQLDEVELOPERCONFIG_CRYPTO_BACKEND.
+"""
+
+import hashlib
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from importlib import import_module
+
+# Name of the backend to use, "auto" or unset to pick the fastest installed one
+CRYPTO_BACKEND_ENV_VAR = "SQLDEVELOPERCONFIG_CRYPTO_BACKEND"
+
+# DES examples of FIPS 81: key, IV, plaintext, ECB ciphertext, CBC ciphertext
+DES_KNOWN_ANSWERS = [
+    (
+        "0123456789abcdef",
+        "1234567890abcdef",
+        "4e6f77206973207468652074696d6520666f7220616c6c20",
+        "3fa40e8a984d48156a271787ab8883f9893d51ec4b563b53",
+        "e5c7cdde872bf27c43e934008c389c0f683788499a7c05f6",
+    ),
+]
+
+# MD5 examples of RFC 1321: message, digest
+MD5_KNOWN_ANSWERS = [
+    ("", "d41d8cd98f00b204e9800998ecf8427e"),
+    ("616263", "900150983cd24fb0d6963f7d28e17f72"),
+]
+
+# Blocks decrypted at once and single passwords decrypted by the benchmark, the same mix as loading an install
+BENCHMARK_BATCH_BLOCKS = 4096
+BENCHMARK_SINGLE_PASSWORDS = 16
+BENCHMARK_REPEATS = 3
+
+
+class CryptoBackend(ABC):
+    """
+    Makes DES ciphers, with the encrypt and decrypt methods of pycryptodomex ciphers, and MD5 digests.
+    MD5 comes from hashlib unless a backend does better, it is faster than the MD5 of either library.
+    """
+
+    name = None
+
+    @abstractmethod
+    def new_ecb(self, key):
+        pass
+
+    @abstractmethod
+    def new_cbc(self, key, iv):
+        pass
+
+    def md5(self, data):
+        return hashlib.md5(data).digest()
+
+
+class PycryptodomexBackend(CryptoBackend):
+    name = "pycryptodomex"
+
+    def __init__(self):
+        self.DES = import_module("Cryptodome.Cipher.DES")
+
+    def new_ecb(self, key):
+        return self.DES.new(key, self.DES.MODE_ECB)
+
+    def new_cbc(self, key, iv):
+        return self.DES.new(key, self.DES.MODE_CBC, iv)
+
+
+class CryptographyCipher:
+    """
+    A cryptography Cipher with the encrypt and decrypt methods of pycryptodomex ciphers
+    """
+
+    def __init__(self, cipher):
+        self.cipher = cipher
+
+    def encrypt(self, data):
+        encryptor = self.cipher.encryptor()
+        return encryptor.update(data) + encryptor.finalize()
+
+    def decrypt(self, data):
+        decryptor = self.cipher.decryptor()
+        return decryptor.update(data) + decryptor.finalize()
+
+
+class CryptographyBackend(CryptoBackend):
+    """
+    cryptography has no single DES, but TripleDES with the same key three times is DES
+    """
+
+    name = "cryptography"
+
+    def __init__(self):
+        self.ciphers = import_module("cryptography.hazmat.primitives.ciphers")
+        try:
+            self.algorithms = import_module("cryptography.hazmat.decrepit.ciphers.algorithms")
+        except ImportError:
+            self.algorithms = self.ciphers.algorithms
+
+    def new_cipher(self, key, mode):
+        return CryptographyCipher(self.ciphers.Cipher(self.algorithms.TripleDES(key * 3), mode))
+
+    def new_ecb(self, key):
+        return self.new_cipher(key, self.ciphers.modes.ECB())
+
+    def new_cbc(self, key, iv):
+        return self.new_cipher(key, self.ciphers.modes.CBC(iv))
+
+
+# Name to backend class, in order of preference when they are as fast
+CRYPTO_BACKENDS = OrderedDict(
+    [
+        (PycryptodomexBackend.name, PycryptodomexBackend),
+        (CryptographyBackend.name, CryptographyBackend),
+    ]
+)
+
+_crypto_backend_name = None
+_crypto_backend = None
+
+
+def set_crypto_backend(name):
+    """
+    Uses the backend with this name from now on, or with None or "auto" the fastest installed one,
+    $SQLDEVELOPERCONFIG_CRYPTO_BACKEND being used when it is set
+    """
+    global _crypto_backend_name, _crypto_backend
+    if name is not None and name != "auto" and name not in CRYPTO_BACKENDS:
+        raise Exception("Unknown crypto backend '{}', expected one of auto, {}".format(name, ", ".join(CRYPTO_BACKENDS)))
+    _crypto_backend_name = name
+    _crypto_backend = None
+
+
+def check_crypto_backend(backend):
+    """
+    Raises unless the backend gives the known answers for DES and MD5
+    """
+    for key, iv, plaintext, ecb_ciphertext, cbc_ciphertext in DES_KNOWN_ANSWERS:
+        key, iv, plaintext = bytes.fromhex(key), bytes.fromhex(iv), bytes.fromhex(plaintext)
+        if (
+            backend.new_ecb(key).encrypt(plaintext).hex() != ecb_ciphertext
+            or backend.new_ecb(key).decrypt(bytes.fromhex(ecb_ciphertext)) != plaintext
+            or backend.new_cbc(key, iv).encrypt(plaintext).hex() != cbc_ciphertext
+            or backend.new_cbc(key, iv).decrypt(bytes.fromhex(cbc_ciphertext)) != plaintext
+        ):
+            raise Exception("Crypto backend {} gives wrong DES results".format(backend.name))
+    for message, digest in MD5_KNOWN_ANSWERS:
+        if backend.md5(bytes.fromhex(message)).hex() != digest:
+            raise Exception("Crypto backend {} gives wrong MD5 results".format(backend.name))
+
+
+def load_crypto_backend(name):
+    """
+    Returns the checked backend with this name, raises when its library is not installed
+    """
+    if name not in CRYPTO_BACKENDS:
+        raise Exception("Unknown crypto backend '{}', expected one of {}".format(name, ", ".join(CRYPTO_BACKENDS)))
+    try:
+        backend = CRYPTO_BACKENDS[name]()
+    except ImportError as ex:
+        raise Exception("Crypto backend {} is not installed: {}".format(name, ex))
+    check_crypto_backend(backend)
+    return backend
+
+
+def available_crypto_backends():
+    """
+    Returns the names of the backends whose library is installed
+    """
+    available = []
+    for name, backend_class in CRYPTO_BACKENDS.items():
+        try:
+            backend_class()
+        except ImportError:
+            continue
+        available.append(name)
+    return available
+
+
+def benchmark_crypto_backend(backend):
+    """
+    Returns the best of BENCHMARK_REPEATS timings, in seconds, of a batch decryption and a few single ones
+    """
+    key, iv = bytes(range(8)), bytes(range(8, 16))
+    batch = bytes(range(256)) * (BENCHMARK_BATCH_BLOCKS // 32)
+    best = None
+    for _ in range(BENCHMARK_REPEATS):
+        start = time.perf_counter()
+        backend.new_ecb(key).decrypt(batch)
+        for single_num in range(BENCHMARK_SINGLE_PASSWORDS):
+            backend.new_cbc(key, iv).decrypt(batch[single_num * 16 : (single_num + 1) * 16])
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def select_crypto_backend():
+    """
+    Returns the fastest installed backend
+    """
+    backends = [load_crypto_backend(name) for name in available_crypto_backends()]
+    if not backends:
+        raise Exception("No crypto backend is installed, install one of {}".format(", ".join(CRYPTO_BACKENDS)))
+    if len(backends) == 1:
+        return backends[0]
+    return min(backends, key=benchmark_crypto_backend)
+
+
+def get_crypto_backend():
+    """
+    Returns the backend in use, loading or selecting it on first use
+    """
+    global _crypto_backend
+    if _crypto_backend is None:
+        name = _crypto_backend_name or os.environ.get(CRYPTO_BACKEND_ENV_VAR) or "auto"
+        _crypto_backend = select_crypto_backend() if name == "auto" else load_crypto_backend(name)
+    return _crypto_backend
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Compares two connections.xml files connection by connection, by name, whatever their formatting and attribute order
+"""
+
+from collections import OrderedDict
+from os.path import isfile, dirname
+
+from sqldeveloperconfig.connections import Connections, Connection, iter_conn_attrs_xml
+from sqldeveloperconfig.profiling import timed
+from sqldeveloperconfig.util import find_install
+
+
+class ConnectionsFile:
+    """
+    The connections of a connections.xml outside of an install, such as an export or a backup. Without a
+    product-preferences.xml their folders are unknown and their passwords cannot be decrypted.
+    """
+
+    folders_known = False
+
+    def __init__(self, connections_file_path):
+        self.file_path = connections_file_path
+        self.connections = OrderedDict()
+        with timed("connections_parse"):
+            for conn_attrs in iter_conn_attrs_xml(connections_file_path):
+                conn = Connection(None, **dict(conn_attrs))
+                self.connections[conn.name] = conn
+
+
+def load_connections_file(connections_path, compare_passwords=False):
+    """
+    Loads a connections.xml to compare, as the Connections of its install when it is in one, or else as a ConnectionsFile,
+    whose passwords cannot be compared
+    """
+    if not isfile(connections_path):
+        raise Exception("No connections file at {}".format(connections_path))
+    if find_install(dirname(dirname(connections_path))).pref_paths:
+        return Connections(connections_path, streaming=True)
+    if compare_passwords:
+        raise Exception("Cannot compare the passwords of {}, which is not in an install of SQLDeveloper with a db.system.id".format(connections_path))
+    return ConnectionsFile(connections_path)
+
+
+def connection_record(conn, compare_passwords):
+    """
+    The folder and attributes of an added or removed connection, with its plaintext_password when passwords are compared
+    """
+    if compare_passwords:
+        return conn.to_json()
+    record = OrderedDict([("folder", conn.folder)])
+    record.update(conn.attrs())
+    return record
+
+
+def diff_connections(old_connections, new_connections, compare_passwords=False, processes=None):
+    """
+    Compares two Connections in one pass over each, matching connections by name. Returns an OrderedDict of the
+    connections "added" and "removed", the "changed" attributes of the others and the number "unchanged".
+    Each changed connection has the attributes "added" and "removed", and {"old", "new"} values of those "changed".
+    With compare_passwords, all passwords are decrypted, in one batch per file, and compared as plaintext_password,
+    so files whose db.system.id differ can be compared. Folders are not compared when either side is a ConnectionsFile.
+    """
+    compare_folders = getattr(old_connections, "folders_known", True) and getattr(new_connections, "folders_known", True)
+    if compare_passwords:
+        old_connections.decrypt_all(processes)
+        new_connections.decrypt_all(processes)
+    old_conns = old_connections.connections
+    new_conns = new_connections.connections
+    added = OrderedDict()
+    changed = OrderedDict()
+    unchanged = 0
+    with timed("diff"):
+        for conn_name, new_conn in new_conns.items():
+            old_conn = old_conns.get(conn_name)
+            if old_conn is None:
+                added[conn_name] = connection_record(new_conn, compare_passwords)
+                continue
+            removed_attrs, added_attrs, changed_attrs = old_conn.diff(new_conn, compare_passwords)
+            if not compare_folders:
+                changed_attrs.pop("folder", None)
+            if not removed_attrs and not added_attrs and not changed_attrs:
+                unchanged += 1
+                continue
+            conn_changes = OrderedDict()
+            conn_changes["added"] = added_attrs
+            conn_changes["removed"] = removed_attrs
+            conn_changes["changed"] = OrderedDict(
+                (attr, OrderedDict([("old", old_value), ("new", new_value)])) for attr, (old_value, new_value) in changed_attrs.items()
+            )
+            changed[conn_name] = conn_changes
+        removed = OrderedDict(
+            (conn_name, connection_record(old_conn, compare_passwords)) for conn_name, old_conn in old_conns.items() if conn_name not in new_conns
+        )
+    result = OrderedDict()
+    result["added"] = added
+    result["removed"] = removed
+    result["changed"] = changed
+    result["unchanged"] = unchanged
+    return result
+
+
+def diff_connections_files(old_path, new_path, compare_passwords=False, processes=None):
+    """
+    Loads two connections.xml files, see load_connections_file, and compares them, see diff_connections
+    """
+    old_connections = load_connections_file(old_path, compare_passwords)
+    new_connections = load_connections_file(new_path, compare_passwords)
+    return diff_connections(old_connections, new_connections, compare_passwords, processes)
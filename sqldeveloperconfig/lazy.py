@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+"""
+Defers importing modules that only some commands need, to keep the start of the command line fast
+"""
+
+import importlib.util
+import sys
+
+
+def lazy_import(module_name):
+    """
+    Returns the module, which is only loaded when one of its attributes is first used
+    """
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(module_name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    loader.exec_module(module)
+    parent_name, _, child_name = module_name.rpartition(".")
+    if parent_name:
+        # As the import system does, so "import parent.child" elsewhere finds it on the parent
+        setattr(sys.modules[parent_name], child_name, module)
+    return module
@@ -2,27 +2,31 @@
 """
 Represents the product-preferences.xml file
 """
-import glob
+import threading
 from collections import OrderedDict
-from os.path import dirname, join, isfile
-from pathlib import Path
-from xml.etree import ElementTree as ET
+from os import stat
+from os.path import dirname, isfile, abspath
 
+from sqldeveloperconfig.cache import load_cached, store_cached, file_cache_stamp, get_cache_dir
 from sqldeveloperconfig.constants import XML_DOCTYPE
-from sqldeveloperconfig.util import to_pretty_xml
+from sqldeveloperconfig.lazy import lazy_import
+from sqldeveloperconfig.profiling import timed, count
+from sqldeveloperconfig.util import to_pretty_xml, write_pretty_xml, find_install, find_installs, atomic_write
+
+ET = lazy_import("xml.etree.ElementTree")
 
 
 def find_ide_connections_elem(prefs_root):
     dfc_elem = prefs_root.find(".//hash[@n='DatabaseFoldersCache']")
-    if not dfc_elem:
+    if dfc_elem is None:
         dfc_elem = ET.Element("hash", attrib={"n": "DatabaseFoldersCache"})
         prefs_root.append(dfc_elem)
     folders_elem = dfc_elem.find("./hash[@n='Folders']")
-    if not folders_elem:
+    if folders_elem is None:
         folders_elem = ET.Element("hash", attrib={"n": "Folders"})
         dfc_elem.append(folders_elem)
     ide_connections_elem = folders_elem.find("./hash[@n='IdeConnections']")
-    if not ide_connections_elem:
+    if ide_connections_elem is None:
         ide_connections_elem = ET.Element("hash", attrib={"n": "IdeConnections"})
         folders_elem.append(ide_connections_elem)
     return ide_connections_elem
@@ -35,19 +39,50 @@ def make_connection_dir_xml(dir_name, connection_names):
     return connection_dir_elem
 
 
+def index_connection_dirs_xml(ide_conns_elem):
+    """
+    Returns dicts of folder name to <list> element, and of connection name to folder name
+    """
+    dir_elems = OrderedDict()
+    conn_dirs = {}
+    for dir_elem in ide_conns_elem.findall("./list"):
+        dir_name = dir_elem.get("n")
+        dir_elems.setdefault(dir_name, dir_elem)
+        for conn_name_elem in dir_elem.findall("./string"):
+            conn_dirs[conn_name_elem.get("v")] = dir_name
+    return dir_elems, conn_dirs
+
+
+def replace_connection_dir_xml(ide_conns_elem, dir_elems, conn_dirs, dir_name, connection_names):
+    """
+    Sets the connections of one folder in place, keeping both indexes up to date
+    """
+    dir_elem = dir_elems.get(dir_name)
+    if dir_elem is None:
+        dir_elem = make_connection_dir_xml(dir_name, [])
+        ide_conns_elem.append(dir_elem)
+        dir_elems[dir_name] = dir_elem
+    else:
+        for conn_name_elem in dir_elem.findall("./string"):
+            conn_name = conn_name_elem.get("v")
+            if conn_dirs.get(conn_name) == dir_name:
+                del conn_dirs[conn_name]
+        del dir_elem[:]
+    for conn_name in connection_names:
+        dir_elem.append(ET.Element("string", attrib={"v": conn_name}))
+        conn_dirs[conn_name] = dir_name
+
+
 def update_all_connection_dirs_xml(prefs_root, connection_dirs):
     ide_conns_elem = find_ide_connections_elem(prefs_root)
+    dir_elems, conn_dirs = index_connection_dirs_xml(ide_conns_elem)
     for new_dir_name, new_connection_names in connection_dirs.items():
-        dir_elem = ide_conns_elem.find("./list[@n='{}']".format(new_dir_name))
-        if dir_elem is not None:
-            ide_conns_elem.remove(dir_elem)
-        new_dir_elem = make_connection_dir_xml(new_dir_name, new_connection_names)
-        ide_conns_elem.append(new_dir_elem)
+        replace_connection_dir_xml(ide_conns_elem, dir_elems, conn_dirs, new_dir_name, new_connection_names)
 
 
 def find_pref_path(conn_path):
     system_dir = dirname(dirname(conn_path))
-    all_prefs_paths = glob.glob(system_dir + "/o.sqldeveloper*/product-preferences.xml")
+    all_prefs_paths = find_install(system_dir).pref_paths
     if len(all_prefs_paths) == 1:
         return all_prefs_paths[0]
     else:
@@ -68,34 +103,127 @@ def find_db_system_id(root):
 
 
 def read_db_system_id(pref_path):
-    tree = ET.parse(pref_path)
-    root = tree.getroot()
-    return find_db_system_id(root)
+    return load_product_preferences(pref_path).db_system_id
+
+
+def file_stamp(file_path):
+    """
+    The (mtime, size) of a file, used to tell whether a parsed file is still current
+    """
+    file_stat = stat(file_path)
+    return file_stat.st_mtime_ns, file_stat.st_size
 
 
 class ProductPreferences:
+    """
+    With the parse cache enabled and current, the db.system.id and the folders come from the cache, and the file is
+    only parsed when the tree is needed, to change or save it
+    """
+
     def __init__(self, file_path):
         if not isfile(file_path):
             raise Exception("Could not find product preferences file, you must open SQLDeveloper at least once before running this script")
         self.file_path = file_path
-        self.tree = ET.parse(self.file_path)
-        self.root = self.tree.getroot()
+        self.stamp = file_stamp(self.file_path)
+        self.modified = False
+        self._tree = None
+        self._ide_conns_elem = None
+        self._dir_elems = None
+        self._conn_dirs = None
+        # (db.system.id, [(folder name, [connection name, ...]), ...]) from the parse cache, None once parsed
+        self._cached = load_cached("preferences", file_path, file_cache_stamp(file_path))
+        if self._cached is None:
+            self._parse()
+
+    def _parse(self):
+        cache_stamp = file_cache_stamp(self.file_path)
+        with timed("preferences_parse"):
+            self._tree = ET.parse(self.file_path)
+        count("preferences_parsed")
+        self._cached = None
+        self._ide_conns_elem = None
+        self._dir_elems = None
+        self._conn_dirs = None
+        self._store_cached(cache_stamp)
+
+    def _store_cached(self, cache_stamp):
+        if get_cache_dir() is None:
+            return
+        dirs = []
+        for dir_elem in self.ide_connections_elem.findall("./list"):
+            dirs.append((dir_elem.get("n"), [conn_name_elem.get("v") for conn_name_elem in dir_elem.findall("./string")]))
+        store_cached("preferences", self.file_path, cache_stamp, (self.db_system_id, dirs))
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._parse()
+        return self._tree
+
+    @property
+    def root(self):
+        return self.tree.getroot()
 
     @property
     def db_system_id(self):
+        if self._cached is not None:
+            return self._cached[0]
         return find_db_system_id(self.root)
 
+    @db_system_id.setter
+    def db_system_id(self, new_value):
+        self.root.find(".//value[@n='db.system.id']").set("v", new_value)
+        self.modified = True
+
+    @property
+    def ide_connections_elem(self):
+        """
+        The IdeConnections element, found once and indexed by folder and by connection name
+        """
+        self._index_connection_dirs()
+        return self._ide_conns_elem
+
+    def _index_connection_dirs(self):
+        if self._ide_conns_elem is None:
+            self._ide_conns_elem = find_ide_connections_elem(self.root)
+            self._dir_elems, self._conn_dirs = index_connection_dirs_xml(self._ide_conns_elem)
+
+    def _cached_conn_dirs(self):
+        if self._conn_dirs is None:
+            self._conn_dirs = {conn_name: dir_name for dir_name, conn_names in self._cached[1] for conn_name in conn_names}
+        return self._conn_dirs
+
+    def find_connection_dir(self, conn_name, default=None):
+        """
+        Returns the folder of a connection
+        """
+        if self._cached is not None:
+            return self._cached_conn_dirs().get(conn_name, default)
+        self._index_connection_dirs()
+        return self._conn_dirs.get(conn_name, default)
+
+    def find_connection_dir_names(self, dir_name):
+        """
+        Returns the connection names in a folder, or None if there is no such folder
+        """
+        if self._cached is not None:
+            return next((list(conn_names) for cached_dir_name, conn_names in self._cached[1] if cached_dir_name == dir_name), None)
+        self._index_connection_dirs()
+        dir_elem = self._dir_elems.get(dir_name)
+        if dir_elem is None:
+            return None
+        return [conn_name_elem.get("v") for conn_name_elem in dir_elem.findall("./string")]
+
     def update_all_connection_dirs(self, connection_dirs):
-        ide_conns_elem = find_ide_connections_elem(self.root)
+        ide_conns_elem = self.ide_connections_elem
         for new_dir_name, new_connection_names in connection_dirs.items():
-            dir_elem = ide_conns_elem.find("./list[@n='{}']".format(new_dir_name))
-            if dir_elem is not None:
-                ide_conns_elem.remove(dir_elem)
-            new_dir_elem = make_connection_dir_xml(new_dir_name, new_connection_names)
-            ide_conns_elem.append(new_dir_elem)
+            replace_connection_dir_xml(ide_conns_elem, self._dir_elems, self._conn_dirs, new_dir_name, new_connection_names)
+        self.modified = True
 
     def load_all_connection_dirs(self):
-        ide_conns_elem = find_ide_connections_elem(self.root)
+        if self._cached is not None:
+            return OrderedDict((dir_name, list(conn_names)) for dir_name, conn_names in self._cached[1])
+        ide_conns_elem = self.ide_connections_elem
         connection_dirs = OrderedDict()
         for dir_elem in ide_conns_elem.findall("./list"):
             connection_names = []
@@ -117,10 +245,20 @@ class ProductPreferences:
     def to_xml_doc(self):
         return XML_DOCTYPE + to_pretty_xml(self.to_xml_elem())
 
-    def save_xml(self):
-        pretty_xml = self.to_xml_doc()
-        with open(self.file_path, "w") as redone_file:
-            redone_file.write(pretty_xml)
+    def save_xml(self, force=False):
+        """
+        Writes the file, unless nothing changed since loading or the last save. Returns True if written.
+        """
+        if not force and not self.modified:
+            return False
+        with timed("write"), atomic_write(self.file_path) as redone_file:
+            redone_file.write(XML_DOCTYPE)
+            write_pretty_xml(self.to_xml_elem(), redone_file)
+        count("files_written")
+        self.modified = False
+        self.stamp = file_stamp(self.file_path)
+        self._store_cached(file_cache_stamp(self.file_path))
+        return True
 
     @classmethod
     def from_connections_file_path(cls, connections_file_path):
@@ -128,7 +266,39 @@ class ProductPreferences:
         return ProductPreferences(pref_path)
 
 
-def find_all_pref_paths():
-    sql_pref_path = join(str(Path.home()), ".sqldeveloper")
-    prefs_paths = glob.glob(sql_pref_path + "/system*/o.sqldeveloper*/product-preferences.xml")
+_prefs_registry = {}
+_prefs_registry_lock = threading.Lock()
+
+
+def load_product_preferences(pref_path):
+    """
+    Returns the ProductPreferences of a file, shared by every caller in the process.
+    The file is parsed again only when its (mtime, size) changes, so unsaved changes to it are shared too.
+    """
+    registry_key = abspath(pref_path)
+    with _prefs_registry_lock:
+        prefs = _prefs_registry.get(registry_key)
+        if prefs is None or not isfile(pref_path) or prefs.stamp != file_stamp(pref_path):
+            prefs = ProductPreferences(pref_path)
+            _prefs_registry[registry_key] = prefs
+        return prefs
+
+
+def forget_product_preferences(pref_path):
+    """
+    Drops the shared ProductPreferences of a file with its unsaved changes, so the next load reads the file again
+    """
+    with _prefs_registry_lock:
+        _prefs_registry.pop(abspath(pref_path), None)
+
+
+def clear_product_preferences_registry():
+    with _prefs_registry_lock:
+        _prefs_registry.clear()
+
+
+def find_all_pref_paths(roots=None):
+    prefs_paths = []
+    for install in find_installs(roots):
+        prefs_paths += install.pref_paths
     return prefs_paths
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Lightweight timers and counters for the hot paths, reported by --profile
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_seconds = OrderedDict()
+_counts = OrderedDict()
+_hooks = []
+
+
+def add_timing_hook(hook):
+    """
+    Calls hook(phase, seconds) every time a timed phase ends
+    """
+    with _lock:
+        _hooks.append(hook)
+
+
+def remove_timing_hook(hook):
+    with _lock:
+        _hooks.remove(hook)
+
+
+def record_time(phase, seconds):
+    with _lock:
+        _seconds[phase] = _seconds.get(phase, 0.0) + seconds
+        hooks = list(_hooks)
+    for hook in hooks:
+        hook(phase, seconds)
+
+
+def count(counter, amount=1):
+    with _lock:
+        _counts[counter] = _counts.get(counter, 0) + amount
+
+
+@contextmanager
+def timed(phase):
+    """
+    Adds the time spent in the with block to the phase
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_time(phase, time.perf_counter() - start)
+
+
+def get_timings():
+    """
+    Returns the seconds spent per phase and the counters, since the start of the process or the last reset_timings
+    """
+    with _lock:
+        return OrderedDict([("seconds", OrderedDict(_seconds)), ("counts", OrderedDict(_counts))])
+
+
+def merge_timings(timings):
+    """
+    Adds timings from get_timings, for instance from a worker process, to this process' timings
+    """
+    for phase, seconds in timings["seconds"].items():
+        record_time(phase, seconds)
+    for counter, amount in timings["counts"].items():
+        count(counter, amount)
+
+
+def reset_timings():
+    with _lock:
+        _seconds.clear()
+        _counts.clear()
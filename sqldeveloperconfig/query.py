@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+"""
+Selects connections by the value of any of their attributes
+"""
+
+import re
+from collections import OrderedDict
+
+
+def parse_attr_arg(attr_arg):
+    """
+    Splits a command line argument of the form ATTR=VALUE into (ATTR, VALUE)
+    """
+    attr, sep, value = attr_arg.partition("=")
+    if not sep or not attr:
+        raise ValueError("Expected ATTR=VALUE, got '{}'".format(attr_arg))
+    return attr, value
+
+
+class ConnectionQuery:
+    """
+    Matches connections whose attributes equal every value in equals and match every regex in matches.
+    The attributes are those of Connection.get, such as hostname, port, sid, user, folder or ConnName.
+    Regexes are compiled once, and exact values are answered from the indexes of Connections when there are any.
+    """
+
+    def __init__(self, equals=(), matches=()):
+        self.equals = OrderedDict(equals)
+        self.matches = [(attr, re.compile(pattern)) for attr, pattern in matches]
+
+    def is_match(self, conn):
+        for attr, value in self.equals.items():
+            if conn.get(attr) != value:
+                return False
+        for attr, regex in self.matches:
+            value = conn.get(attr)
+            if not regex.search("" if value is None else value):
+                return False
+        return True
+
+    def select(self, connections):
+        """
+        Returns the (name, connection) pairs of a Connections (or a dict of connections) that match
+        """
+        candidates = connections
+        if self.equals and hasattr(connections, "lookup"):
+            candidates = min((connections.lookup(attr, value) for attr, value in self.equals.items()), key=len)
+        return [(conn_name, conn) for conn_name, conn in candidates.items() if self.is_match(conn)]
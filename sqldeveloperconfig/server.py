@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+"""
+Keeps the connections of every install in memory and answers requests about them over a local Unix socket.
+Requests and responses are JSON objects, one per line, several requests may be sent on one connection.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from os.path import join
+
+from sqldeveloperconfig.cache import file_cache_stamp
+from sqldeveloperconfig.connections import Connections, add_to_all_connections, check_connection_attrs
+from sqldeveloperconfig.preferences import find_pref_path, forget_product_preferences
+from sqldeveloperconfig.query import ConnectionQuery
+from sqldeveloperconfig.util import find_all_connection_paths, clear_installs_cache
+
+# Seconds between searches for new or removed installs, the files of known installs are checked on every request
+DISCOVERY_INTERVAL = 60
+
+
+def default_socket_path():
+    """
+    sqldeveloperconfig.sock in $XDG_RUNTIME_DIR, or in the temporary directory with the user id in its name
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return join(runtime_dir, "sqldeveloperconfig.sock")
+    return join(tempfile.gettempdir(), "sqldeveloperconfig-{}.sock".format(os.getuid()))
+
+
+def format_error(ex):
+    return "{}: {}".format(type(ex).__name__, ex)
+
+
+class ServedInstalls:
+    """
+    The Connections of every install, loaded again when connections.xml or product-preferences.xml changes
+    """
+
+    def __init__(self, discovery_interval=DISCOVERY_INTERVAL):
+        self.discovery_interval = discovery_interval
+        self._discovered_at = None
+        self._connections_paths = []
+        # Connections path to ((connections.xml stamp, product-preferences.xml stamp), Connections)
+        self._loaded = {}
+
+    def _stamps(self, connections_path):
+        return file_cache_stamp(connections_path), file_cache_stamp(find_pref_path(connections_path))
+
+    def load_all(self):
+        """
+        Returns an OrderedDict of connections path to current Connections, and one of connections path to error
+        """
+        if self._discovered_at is None or time.monotonic() - self._discovered_at >= self.discovery_interval:
+            clear_installs_cache()
+            self._connections_paths = find_all_connection_paths()
+            self._discovered_at = time.monotonic()
+        all_connections = OrderedDict()
+        errors = OrderedDict()
+        for connections_path in self._connections_paths:
+            try:
+                stamps = self._stamps(connections_path)
+                loaded_stamps, connections = self._loaded.get(connections_path, (None, None))
+                if stamps != loaded_stamps:
+                    connections = Connections(connections_path, streaming=True)
+                    self._loaded[connections_path] = (stamps, connections)
+                all_connections[connections_path] = connections
+            except Exception as ex:
+                self._loaded.pop(connections_path, None)
+                errors[connections_path] = format_error(ex)
+        return all_connections, errors
+
+    def forget(self, connections_path):
+        """
+        Forgets a loaded install with its unsaved changes, product-preferences.xml included, so it is loaded again from its files
+        """
+        stamps, connections = self._loaded.pop(connections_path, (None, None))
+        if connections is not None and connections.prod_prefs.modified:
+            forget_product_preferences(connections.prod_prefs.file_path)
+
+    def reset(self):
+        """
+        Forgets every loaded install, so they are loaded again from their files
+        """
+        for connections_path in list(self._loaded):
+            self.forget(connections_path)
+
+    def save(self, connections_path):
+        """
+        Commits the changes to an install, remembering the new stamps of its files so they are not loaded again.
+        If another writer changed its files since they were loaded, its changes are dropped and it is loaded again by the next request.
+        """
+        stamps, connections = self._loaded[connections_path]
+        try:
+            connections.commit()
+        except Exception:
+            self.forget(connections_path)
+            raise
+        self._loaded[connections_path] = (self._stamps(connections_path), connections)
+
+
+def make_request_query(request):
+    return ConnectionQuery(request.get("where", []), request.get("match", []))
+
+
+def serve_ping(installs, request):
+    return "pong", {}
+
+
+def serve_show(installs, request):
+    """
+    The connections matching "where" and "match", with their passwords, and the db.system.id of every install
+    """
+    query = make_request_query(request)
+    all_connections, errors = installs.load_all()
+    result = OrderedDict()
+    for connections_path, connections in all_connections.items():
+        matches = query.select(connections)
+        conn_file = OrderedDict()
+        conn_file["connections"] = OrderedDict((conn_name, conn.to_json()) for conn_name, conn in matches)
+        conn_file["db_system_id"] = connections.prod_prefs.db_system_id
+        result[connections_path] = conn_file
+    return result, errors
+
+
+def serve_set_passwords(installs, request):
+    """
+    Sets the password of the connections matching "where" and "match" to "password", or only lists them with "dry_run"
+    """
+    query = make_request_query(request)
+    dry_run = request.get("dry_run", False)
+    if not dry_run and "password" not in request:
+        raise Exception("Expected a password")
+    all_connections, errors = installs.load_all()
+    result = []
+    for connections_path, connections in all_connections.items():
+        try:
+            matches = query.select(connections)
+            if not dry_run:
+                connections.set_passwords(OrderedDict((conn_name, request["password"]) for conn_name, conn in matches))
+                installs.save(connections_path)
+            result += [conn_name for conn_name, conn in matches]
+        except Exception as ex:
+            installs.forget(connections_path)
+            errors[connections_path] = format_error(ex)
+    return result, errors
+
+
+def serve_add_connections(installs, request):
+    """
+    Adds the "connections", a list of attribute objects, to every install
+    """
+    connection_attrs_list = request.get("connections", [])
+    for record_num, conn_attrs in enumerate(connection_attrs_list):
+        try:
+            check_connection_attrs(conn_attrs)
+        except Exception as ex:
+            raise Exception("Connection {}: {}".format(record_num + 1, ex))
+    all_connections, errors = installs.load_all()
+    summaries = add_to_all_connections(all_connections, connection_attrs_list)
+    result = OrderedDict()
+    for connections_path in all_connections:
+        try:
+            installs.save(connections_path)
+            result[connections_path] = summaries[connections_path]
+        except Exception as ex:
+            errors[connections_path] = format_error(ex)
+    return result, errors
+
+
+# Request "command" to function(installs, request) returning (result, errors)
+SERVER_COMMANDS = {
+    "ping": serve_ping,
+    "show": serve_show,
+    "set_passwords": serve_set_passwords,
+    "add_connections": serve_add_connections,
+}
+
+
+class ConnectionsRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for request_line in self.rfile:
+            if request_line.strip():
+                response = self.server.respond(request_line)
+                self.wfile.write(json.dumps(response).encode("utf8") + b"\n")
+                self.wfile.flush()
+
+
+class ConnectionsServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves SERVER_COMMANDS on a Unix socket only its user can connect to.
+    Each client has its own thread, but requests are answered one at a time.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, installs=None):
+        self.socket_path = socket_path
+        self.installs = ServedInstalls() if installs is None else installs
+        self.requests_served = 0
+        self._lock = threading.Lock()
+        super().__init__(socket_path, ConnectionsRequestHandler)
+
+    def server_bind(self):
+        if os.path.exists(self.socket_path):
+            if is_serving(self.socket_path):
+                raise Exception("A server is already listening on {}".format(self.socket_path))
+            os.remove(self.socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def respond(self, request_line):
+        """
+        Returns the response to one request, a JSON object with a "command".
+        After a failed request every install is loaded again, so no half done change is kept.
+        """
+        with self._lock:
+            self.requests_served += 1
+            try:
+                request = json.loads(request_line)
+                command = request.get("command") if isinstance(request, dict) else None
+                if command not in SERVER_COMMANDS:
+                    raise Exception("Unknown command '{}', expected one of {}".format(command, ", ".join(SERVER_COMMANDS)))
+                result, errors = SERVER_COMMANDS[command](self.installs, request)
+            except Exception as ex:
+                self.installs.reset()
+                return OrderedDict([("status", "error"), ("error", format_error(ex))])
+        response = OrderedDict([("result", result), ("status", "ok")])
+        if errors:
+            response["status"] = "error"
+            response["errors"] = errors
+        return response
+
+
+def is_serving(socket_path):
+    """
+    True when a server accepts connections on socket_path
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client_socket:
+        try:
+            client_socket.connect(socket_path)
+        except OSError:
+            return False
+    return True
+
+
+def send_request(socket_path, request):
+    """
+    Sends one request to the server on socket_path and returns its response
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client_socket:
+        client_socket.connect(socket_path)
+        with client_socket.makefile("rwb") as socket_file:
+            socket_file.write(json.dumps(request).encode("utf8") + b"\n")
+            socket_file.flush()
+            response_line = socket_file.readline()
+    if not response_line:
+        raise Exception("The server on {} closed the connection without answering".format(socket_path))
+    return json.loads(response_line, object_pairs_hook=OrderedDict)
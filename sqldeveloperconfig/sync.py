@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+"""
+Merges a catalog of connections into installs, keeping the changes made in each install since its last sync.
+The state of the catalog at the last sync, the baseline, is kept in a file next to connections.xml.
+"""
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from os.path import dirname, join, isfile
+
+from sqldeveloperconfig.connections import Connections, check_connection_attrs, make_connections, install_lock
+from sqldeveloperconfig.cryption import encrypt_v4_many
+from sqldeveloperconfig.profiling import count
+from sqldeveloperconfig.util import atomic_write
+
+SYNC_BASELINE_FILE_NAME = "sqldeveloperconfig-sync.json"
+
+# Bumped when the format of the baseline changes, older baselines are then ignored as if the install was never synced
+SYNC_BASELINE_VERSION = 1
+
+# Marks an attribute missing from the catalog or the baseline, since None is a valid value
+MISSING = object()
+
+
+def baseline_path(connections_path):
+    return join(dirname(connections_path), SYNC_BASELINE_FILE_NAME)
+
+
+def new_baseline():
+    return OrderedDict([("version", SYNC_BASELINE_VERSION), ("salt", os.urandom(16).hex()), ("connections", OrderedDict())])
+
+
+def load_baseline(connections_path):
+    """
+    Returns the baseline of an install, an empty one when it was never synced
+    """
+    path = baseline_path(connections_path)
+    if not isfile(path):
+        return new_baseline()
+    with open(path) as baseline_file:
+        baseline = json.load(baseline_file, object_pairs_hook=OrderedDict)
+    if baseline.get("version") != SYNC_BASELINE_VERSION:
+        return new_baseline()
+    return baseline
+
+
+def save_baseline(connections_path, baseline):
+    with atomic_write(baseline_path(connections_path)) as baseline_file:
+        json.dump(baseline, baseline_file, indent=2)
+    count("files_written")
+
+
+def password_digest(salt, plaintext_password):
+    """
+    Salted SHA-256 of a catalog password, so the baseline tells when it changes without holding it
+    """
+    if plaintext_password is None:
+        return None
+    return hashlib.sha256(bytes.fromhex(salt) + plaintext_password.encode("utf8")).hexdigest()
+
+
+def read_catalog(connection_attrs_iter):
+    """
+    Returns an OrderedDict of connection name to attributes, which may have a folder and a plaintext_password.
+    A connection given twice keeps its last attributes.
+    """
+    catalog = OrderedDict()
+    for record_num, conn_attrs in enumerate(connection_attrs_iter):
+        try:
+            check_connection_attrs(conn_attrs)
+            if not conn_attrs.get("ConnName"):
+                raise Exception("Expected a ConnName")
+            if "password" in conn_attrs:
+                raise Exception("Expected a plaintext_password rather than an encrypted password")
+        except Exception as ex:
+            raise Exception("Connection {}: {}".format(record_num + 1, ex))
+        catalog[conn_attrs["ConnName"]] = conn_attrs
+    return catalog
+
+
+def catalog_entry(conn_attrs, salt):
+    """
+    The baseline entry of a catalog connection: its attributes, folder included, and the digest of its password if it has one
+    """
+    attrs = OrderedDict((key, value) for key, value in conn_attrs.items() if key != "plaintext_password")
+    entry = OrderedDict([("attrs", attrs)])
+    if "plaintext_password" in conn_attrs:
+        entry["password_digest"] = password_digest(salt, conn_attrs["plaintext_password"])
+    return entry
+
+
+def locally_changed_attrs(conn, entry):
+    """
+    The attributes of a connection that differ from what was synced to it, "plaintext_password" for its password
+    """
+    changed = [attr for attr, value in entry["attrs"].items() if conn.get_attr(attr) != value]
+    if "password" in entry and conn.encrypted_password != entry["password"]:
+        changed.append("plaintext_password")
+    return changed
+
+
+def sync_connections(connections, catalog, baseline):
+    """
+    Merges the catalog into the connections, three way with the catalog of the last sync in baseline:
+    - an attribute the catalog did not change since the last sync keeps its local value,
+    - one the catalog changed is set, and listed under "conflicts" when it had been changed locally too,
+    - a connection deleted locally stays deleted unless the catalog changed it, a connection removed from the catalog
+      is removed unless it was changed locally.
+    Passwords are only encrypted when the catalog changed them, or on the first sync of a connection.
+    Returns a summary of the changes and the new baseline, nothing is saved.
+    """
+    salt = baseline["salt"]
+    base_entries = baseline["connections"]
+    db_system_id = connections.prod_prefs.db_system_id
+    summary = OrderedDict([("added", []), ("updated", OrderedDict()), ("removed", []), ("conflicts", OrderedDict())])
+    new_entries = OrderedDict()
+    to_add = []
+    # (connection, catalog password, whether its password had been changed locally)
+    to_encrypt = []
+
+    for conn_name, conn_attrs in catalog.items():
+        entry = catalog_entry(conn_attrs, salt)
+        base_entry = base_entries.get(conn_name)
+        base_attrs = base_entry["attrs"] if base_entry is not None else {}
+        conn = connections.connections.get(conn_name)
+        if conn is None:
+            if base_entry is not None and base_attrs == entry["attrs"] and base_entry.get("password_digest", MISSING) == entry.get("password_digest", MISSING):
+                new_entries[conn_name] = base_entry
+                continue
+            if base_entry is not None:
+                summary["conflicts"][conn_name] = [attr for attr, value in entry["attrs"].items() if base_attrs.get(attr, MISSING) != value]
+            to_add.append((conn_attrs, entry))
+            continue
+        locally_changed = locally_changed_attrs(conn, base_entry) if base_entry is not None else []
+        updated = []
+        for attr, value in entry["attrs"].items():
+            if base_attrs.get(attr, MISSING) == value or conn.get_attr(attr) == value:
+                continue
+            if attr in locally_changed:
+                summary["conflicts"].setdefault(conn_name, []).append(attr)
+            conn.set_attr(attr, value)
+            updated.append(attr)
+        if updated:
+            summary["updated"][conn_name] = updated
+        if base_entry is not None and "password" in base_entry and "password_digest" in entry:
+            entry["password"] = base_entry["password"]
+        if "password_digest" in entry and (base_entry is None or base_entry.get("password_digest", MISSING) != entry["password_digest"]):
+            to_encrypt.append((conn, conn_attrs["plaintext_password"], "plaintext_password" in locally_changed))
+        new_entries[conn_name] = entry
+
+    encrypted_list = encrypt_v4_many([plaintext for conn, plaintext, conflict in to_encrypt], db_system_id)
+    for (conn, plaintext, conflict), encrypted in zip(to_encrypt, encrypted_list):
+        if conn.encrypted_password != encrypted:
+            if conflict:
+                summary["conflicts"].setdefault(conn.name, []).append("plaintext_password")
+            conn.encrypted_password = encrypted
+            conn._plaintext_password = plaintext
+            summary["updated"].setdefault(conn.name, []).append("plaintext_password")
+        new_entries[conn.name]["password"] = encrypted
+
+    for conn in make_connections(db_system_id, [conn_attrs for conn_attrs, entry in to_add]):
+        connections.add_connection(conn)
+        summary["added"].append(conn.name)
+    for conn_attrs, entry in to_add:
+        if "password_digest" in entry:
+            entry["password"] = connections.connections[conn_attrs["ConnName"]].encrypted_password
+        new_entries[conn_attrs["ConnName"]] = entry
+
+    for conn_name, base_entry in base_entries.items():
+        conn = connections.connections.get(conn_name)
+        if conn_name in catalog or conn is None:
+            continue
+        locally_changed = locally_changed_attrs(conn, base_entry)
+        if locally_changed:
+            summary["conflicts"][conn_name] = locally_changed
+        else:
+            connections.pop_connection(conn_name)
+            summary["removed"].append(conn_name)
+
+    # In catalog order, as connections added above came last, so an unchanged catalog gives an identical baseline
+    new_entries = OrderedDict((conn_name, new_entries[conn_name]) for conn_name in catalog)
+    new_baseline = OrderedDict([("version", SYNC_BASELINE_VERSION), ("salt", salt), ("connections", new_entries)])
+    return summary, new_baseline
+
+
+def sync_install(connections_path, catalog, dry_run=False):
+    """
+    Syncs the catalog to one install, see sync_connections. connections.xml, product-preferences.xml and the baseline
+    are only written when they change, or never with dry_run. Returns the summary with whether files were "written".
+    The install is locked from loading to writing the baseline, so concurrent syncs and edits of it are serialized.
+    """
+    if dry_run:
+        summary, new_baseline = sync_connections(Connections(connections_path, streaming=True), catalog, load_baseline(connections_path))
+        summary["written"] = False
+        return summary
+    with install_lock(connections_path):
+        connections = Connections(connections_path, streaming=True)
+        baseline = load_baseline(connections_path)
+        summary, new_baseline = sync_connections(connections, catalog, baseline)
+        written = connections.commit()
+        if new_baseline != baseline:
+            save_baseline(connections_path, new_baseline)
+            written = True
+    summary["written"] = written
+    return summary
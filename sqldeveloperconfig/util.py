@@ -1,8 +1,49 @@
-import glob
-from copy import deepcopy
-from os.path import join, dirname
-from pathlib import Path
-from xml.etree import ElementTree as ET
+import fcntl
+import json
+import os
+import stat
+import threading
+import time
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
+from io import StringIO
+from os.path import join, dirname, basename, realpath, expanduser
+
+from sqldeveloperconfig.lazy import lazy_import
+from sqldeveloperconfig.profiling import timed
+
+ET = lazy_import("xml.etree.ElementTree")
+glob = lazy_import("glob")
+tempfile = lazy_import("tempfile")
+
+# Separated by os.pathsep, each root may be a glob such as /home/*/.sqldeveloper
+SEARCH_ROOTS_ENV_VAR = "SQLDEVELOPERCONFIG_ROOTS"
+
+# One system* directory of an install, with every connections.xml and product-preferences.xml found in it
+Install = namedtuple("Install", ["system_dir", "connections_paths", "pref_paths"])
+
+# Characters read at a time by iter_json_values
+JSON_CHUNK_SIZE = 65536
+
+# Prefixes ElementTree gives these namespaces when writing, other namespaces are numbered ns0, ns1...
+XML_NAMESPACE_PREFIXES = {
+    "http://www.w3.org/XML/1998/namespace": "xml",
+    "http://www.w3.org/1999/xhtml": "html",
+    "http://www.w3.org/1999/02/22-rdf-syntax-ns#": "rdf",
+    "http://schemas.xmlsoap.org/wsdl/": "wsdl",
+    "http://www.w3.org/2001/XMLSchema": "xs",
+    "http://www.w3.org/2001/XMLSchema-instance": "xsi",
+    "http://purl.org/dc/elements/1.1/": "dc",
+}
+
+# Seconds between attempts to take a lock held by another process, when waiting with a timeout
+LOCK_POLL_INTERVAL = 0.05
+
+_search_roots = None
+_installs_cache = {}
+_installs_by_system_dir = {}
+# Per thread, real path of each lock file held to how many times it was taken
+_held_locks = threading.local()
 
 
 def indent_xml(elem, level=0):
@@ -24,22 +65,356 @@ def indent_xml(elem, level=0):
             elem.tail = i
 
 
-def to_pretty_xml(elem: ET.Element) -> str:
+def escape_xml_text(text):
+    """
+    Escapes the text or tail of an Element
+    """
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def escape_xml_attr(value):
+    """
+    Escapes an attribute value, written between double quotes, keeping its line breaks and tabs as ElementTree does
+    """
+    return escape_xml_text(value).replace('"', "&quot;").replace("\r", "&#13;").replace("\n", "&#10;").replace("\t", "&#09;")
+
+
+def xml_qnames(elem):
+    """
+    Returns the prefix:name of every tag and attribute name of an Element and its descendants, and the prefix of every
+    namespace they use, as ElementTree names them when writing
+    """
+    qnames = {None: None}
+    namespaces = {}
+
+    def add_qname(qname):
+        if qname[:1] != "{":
+            qnames[qname] = qname
+            return
+        uri, local_name = qname[1:].rsplit("}", 1)
+        prefix = namespaces.get(uri)
+        if prefix is None:
+            prefix = XML_NAMESPACE_PREFIXES.get(uri) or "ns{}".format(len(namespaces))
+            if prefix != "xml":
+                namespaces[uri] = prefix
+        qnames[qname] = "{}:{}".format(prefix, local_name)
+
+    for descendant in elem.iter():
+        tag = descendant.tag
+        if isinstance(tag, ET.QName):
+            tag = tag.text
+        if isinstance(tag, str) and tag not in qnames:
+            add_qname(tag)
+        for key, value in descendant.items():
+            if isinstance(key, ET.QName):
+                key = key.text
+            if key not in qnames:
+                add_qname(key)
+            if isinstance(value, ET.QName) and value.text not in qnames:
+                add_qname(value.text)
+    return qnames, namespaces
+
+
+def pretty_text(elem, level, has_children):
+    """
+    The text of an Element once indented by indent_xml
+    """
+    text = elem.text
+    if has_children and (not text or not text.strip()):
+        text = "\n" + (level + 1) * "  "
+    return text
+
+
+def pretty_tail(elem, level, is_last, has_children):
+    """
+    The tail of an Element once indented by indent_xml, is_last when it is the last child of its parent
+    """
+    tail = elem.tail
+    if not tail or not tail.strip():
+        if is_last:
+            tail = "\n" + (level - 1) * "  "
+        elif has_children or level:
+            tail = "\n" + level * "  "
+    return tail
+
+
+def write_start_xml(write, elem, level, qnames, namespaces, has_children):
+    """
+    Writes the start tag and text of an Element, returns the tag still to be closed or "" if there is none
+    """
+    tag = elem.tag
+    text = pretty_text(elem, level, has_children)
+    if tag is ET.Comment:
+        write("<!--%s-->" % text)
+        return ""
+    if tag is ET.ProcessingInstruction:
+        write("<?%s?>" % text)
+        return ""
+    tag = qnames[tag]
+    if tag is None:
+        if text:
+            write(escape_xml_text(text))
+        return ""
+    write("<" + tag)
+    if namespaces:
+        for namespace_uri, prefix in sorted(namespaces.items(), key=lambda item: item[1]):
+            if prefix:
+                prefix = ":" + prefix
+            write(' xmlns%s="%s"' % (prefix, escape_xml_attr(namespace_uri)))
+    for key, value in elem.items():
+        if isinstance(key, ET.QName):
+            key = key.text
+        if isinstance(value, ET.QName):
+            value = qnames[value.text]
+        else:
+            value = escape_xml_attr(value)
+        write(' %s="%s"' % (qnames[key], value))
+    if not text and not has_children:
+        write(" />")
+        return ""
+    write(">")
+    if text:
+        write(escape_xml_text(text))
+    return tag
+
+
+def write_pretty_tree(write, elem, level, is_last, qnames, namespaces):
+    """
+    Writes an Element and its children, indented as the child of another at level - 1 by indent_xml
+    """
+    # Entries are (element, level, is_last, closing_tag), closing_tag is None until the element is started
+    stack = [(elem, level, is_last, None)]
+    while stack:
+        elem, level, is_last, closing_tag = stack.pop()
+        if closing_tag is None:
+            closing_tag = write_start_xml(write, elem, level, qnames, namespaces if level == 0 else None, len(elem) > 0)
+            if len(elem):
+                stack.append((elem, level, is_last, closing_tag))
+                last_child_num = len(elem) - 1
+                for child_num in range(last_child_num, -1, -1):
+                    stack.append((elem[child_num], level + 1, child_num == last_child_num, None))
+                continue
+        if closing_tag:
+            write("</" + closing_tag + ">")
+        tail = pretty_tail(elem, level, is_last, len(elem) > 0)
+        if tail:
+            write(escape_xml_text(tail))
+
+
+def write_pretty_xml(elem: "ET.Element", out_file, children=None):
+    """
+    Writes pretty, indented XML representing an Element to a file handle as it walks the tree.
+    The Element is neither copied nor modified, the output is the same as ET.tostring after indent_xml.
+    With children, an iterable of Elements without namespaces, they are written as the children of elem, which has none
+    of its own, as they are produced, so the whole tree is never held at once.
+    """
+
+    def write(xml_str):
+        if not xml_str.isascii():
+            xml_str = xml_str.encode("ascii", "xmlcharrefreplace").decode("ascii")
+        out_file.write(xml_str)
+
+    qnames, namespaces = xml_qnames(elem)
+    children = iter(() if children is None else children)
+    child = next(children, None)
+    if child is None:
+        write_pretty_tree(write, elem, 0, False, qnames, namespaces)
+        return
+    closing_tag = write_start_xml(write, elem, 0, qnames, namespaces, True)
+    while child is not None:
+        next_child = next(children, None)
+        child_qnames, child_namespaces = xml_qnames(child)
+        if child_namespaces:
+            raise Exception("Cannot write children with namespaces one at a time: '{}'".format(child.tag))
+        write_pretty_tree(write, child, 1, next_child is None, child_qnames, None)
+        child = next_child
+    if closing_tag:
+        write("</" + closing_tag + ">")
+    tail = pretty_tail(elem, 0, False, True)
+    if tail:
+        write(escape_xml_text(tail))
+
+
+def to_pretty_xml(elem: "ET.Element") -> str:
     """
     Returns a string of pretty, indented XML, representing an Element
     """
-    elem_copy = deepcopy(elem)
-    indent_xml(elem_copy)
-    byte_string = ET.tostring(elem_copy)
-    return byte_string.decode()
+    pretty_xml = StringIO()
+    write_pretty_xml(elem, pretty_xml)
+    return pretty_xml.getvalue()
+
+
+@contextmanager
+def atomic_write(file_path, mode="w"):
+    """
+    Opens a temporary file next to file_path, then replaces file_path with it once it is written and synced to disk,
+    then syncs the directory so the rename survives a crash. Readers see the old file or the new one, never part of it.
+    On error the temporary file is removed.
+    The mode of an existing file is kept, a new file is only readable by its owner since it may hold passwords.
+    """
+    file_path = realpath(file_path)
+    temp_fd, temp_path = tempfile.mkstemp(prefix="." + basename(file_path) + ".", suffix=".tmp", dir=dirname(file_path))
+    try:
+        with os.fdopen(temp_fd, mode) as temp_file:
+            yield temp_file
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        if os.path.exists(file_path):
+            os.chmod(temp_path, stat.S_IMODE(os.stat(file_path).st_mode))
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    # The rename is only durable once the directory holding the file is synced too
+    dir_fd = os.open(dirname(file_path), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+@contextmanager
+def file_lock(lock_path, timeout=None):
+    """
+    Holds an exclusive advisory lock (flock) on lock_path, created if needed, for the with block.
+    Waits for other holders forever, or raises after timeout seconds. A thread may take a lock it already holds again.
+    """
+    lock_path = realpath(lock_path)
+    if not hasattr(_held_locks, "depths"):
+        _held_locks.depths = {}
+    if lock_path in _held_locks.depths:
+        _held_locks.depths[lock_path] += 1
+        try:
+            yield
+        finally:
+            _held_locks.depths[lock_path] -= 1
+        return
+    lock_fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        with timed("lock_wait"):
+            if timeout is None:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            else:
+                deadline = time.monotonic() + timeout
+                while True:
+                    try:
+                        fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() >= deadline:
+                            raise Exception("Timed out after {}s waiting for the lock {}".format(timeout, lock_path))
+                        time.sleep(LOCK_POLL_INTERVAL)
+        _held_locks.depths[lock_path] = 1
+        try:
+            yield
+        finally:
+            del _held_locks.depths[lock_path]
+    finally:
+        # Closing the file releases the lock
+        os.close(lock_fd)
 
 
-def find_all_connection_paths():
+def set_search_roots(roots):
+    """
+    Sets the directories searched for installs of SQLDeveloper, None restores the default
+    """
+    global _search_roots
+    _search_roots = list(roots) if roots else None
+
+
+def get_search_roots():
+    """
+    The roots from set_search_roots, else from the SQLDEVELOPERCONFIG_ROOTS environment variable, else ~/.sqldeveloper
+    """
+    if _search_roots:
+        return _search_roots
+    env_roots = [root for root in os.environ.get(SEARCH_ROOTS_ENV_VAR, "").split(os.pathsep) if root]
+    if env_roots:
+        return env_roots
+    return [join(expanduser("~"), ".sqldeveloper")]
+
+
+def scan_subdirs(dir_path, prefix):
+    """
+    Returns the sorted paths of the subdirectories whose names start with prefix
+    """
+    try:
+        with os.scandir(dir_path) as entries:
+            return sorted(entry.path for entry in entries if entry.name.startswith(prefix) and entry.is_dir())
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        return []
+
+
+def scan_install(system_dir):
+    """
+    Finds the connections.xml and product-preferences.xml files of one system* directory in a single pass
+    """
+    connections_paths = []
+    pref_paths = []
+    try:
+        with os.scandir(system_dir) as entries:
+            subdirs = sorted((entry.name, entry.path) for entry in entries if entry.is_dir())
+    except (FileNotFoundError, NotADirectoryError, PermissionError):
+        subdirs = []
+    for subdir_name, subdir_path in subdirs:
+        if subdir_name.startswith("o.jdeveloper.db.connection"):
+            connections_path = join(subdir_path, "connections.xml")
+            if os.path.isfile(connections_path):
+                connections_paths.append(connections_path)
+        elif subdir_name.startswith("o.sqldeveloper"):
+            pref_path = join(subdir_path, "product-preferences.xml")
+            if os.path.isfile(pref_path):
+                pref_paths.append(pref_path)
+    install = Install(system_dir, connections_paths, pref_paths)
+    _installs_by_system_dir[system_dir] = install
+    return install
+
+
+def find_installs(roots=None):
+    """
+    Finds every install under the search roots, walking each root once. Cached for the rest of the run.
+    """
+    if roots is None:
+        roots = get_search_roots()
+    cache_key = tuple(roots)
+    if cache_key not in _installs_cache:
+        with timed("discovery"):
+            expanded_roots = OrderedDict()
+            for root in roots:
+                root = os.path.expanduser(root)
+                for expanded_root in sorted(glob.glob(root)) if glob.has_magic(root) else [root]:
+                    expanded_roots[expanded_root] = True
+            installs = []
+            for root in expanded_roots:
+                for system_dir in scan_subdirs(root, "system"):
+                    installs.append(scan_install(system_dir))
+        _installs_cache[cache_key] = installs
+    return _installs_cache[cache_key]
+
+
+def find_install(system_dir):
+    """
+    Returns the install of a system* directory, from the discovery cache when possible
+    """
+    install = _installs_by_system_dir.get(system_dir)
+    if install is None:
+        install = scan_install(system_dir)
+    return install
+
+
+def clear_installs_cache():
+    _installs_cache.clear()
+    _installs_by_system_dir.clear()
+
+
+def find_all_connection_paths(roots=None):
     """
     Finds every connections.xml file path
     """
-    sql_pref_path = join(str(Path.home()), ".sqldeveloper")
-    connections_paths = glob.glob(sql_pref_path + "/system*/o.jdeveloper.db.connection*/connections.xml")
+    connections_paths = []
+    for install in find_installs(roots):
+        connections_paths += install.connections_paths
     return connections_paths
 
 
@@ -48,7 +423,7 @@ def find_connections_path(pref_path):
     Given a preferences.xml path, returns the path to connections.xml
     """
     system_dir = dirname(dirname(pref_path))
-    all_connections_paths = glob.glob(system_dir + "/o.jdeveloper.db.connection*/connections.xml")
+    all_connections_paths = find_install(system_dir).connections_paths
     if len(all_connections_paths) == 1:
         return all_connections_paths[0]
     else:
@@ -58,6 +433,60 @@ def find_connections_path(pref_path):
             raise Exception("Multiple connections files found")
 
 
+def iter_json_values(json_file, chunk_size=JSON_CHUNK_SIZE):
+    """
+    Yields each JSON value of a file holding one value, several values one after another (such as NDJSON) or arrays of
+    them, reading chunk_size characters at a time. The elements of top level arrays are yielded one by one, so memory
+    does not grow with the file.
+    """
+    decoder = json.JSONDecoder(object_pairs_hook=OrderedDict)
+    buf = ""
+    pos = 0
+    at_eof = False
+    in_array = False
+    while True:
+        while pos < len(buf) and (buf[pos].isspace() or (in_array and buf[pos] == ",")):
+            pos += 1
+        if pos == len(buf) or (buf[pos] not in "[]" and not at_eof and len(buf) - pos < chunk_size):
+            chunk = json_file.read(chunk_size)
+            if not chunk:
+                at_eof = True
+                if pos == len(buf):
+                    break
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        if buf[pos] == "[" and not in_array:
+            in_array = True
+            pos += 1
+            continue
+        if buf[pos] == "]" and in_array:
+            in_array = False
+            pos += 1
+            continue
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if at_eof:
+                raise
+            chunk = json_file.read(chunk_size)
+            at_eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        if not at_eof and not isinstance(value, (dict, list, str)) and (end == len(buf) or buf[end] in ".eE0123456789"):
+            # A number or literal cut by the end of the buffer may continue in the next chunk
+            chunk = json_file.read(chunk_size)
+            at_eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        pos = end
+        yield value
+    if in_array:
+        raise json.JSONDecodeError("Unterminated array", buf, pos)
+
+
 def ask_yes_no(prompt, default="", input_fn=input) -> bool:
     """
     Ask the user for a yes or no response, returns True for yes, False for no
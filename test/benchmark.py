@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Times loading, decrypting, mutating and saving fake SQLDeveloper homes of several sizes, prints the timings as JSON
+
+Examples:
+  python3 -m test.benchmark
+  python3 -m test.benchmark --scales 1000 10000 100000 --installs 4 --folders 100 --pref-size 5000000 > bench_output.txt
+"""
+
+import argparse
+import json
+import platform
+import time
+from collections import OrderedDict
+from tempfile import TemporaryDirectory
+
+from sqldeveloperconfig.__main__ import mod_set_passwords, parse_args as parse_main_args
+from sqldeveloperconfig.connections import Connections
+from sqldeveloperconfig.cryption import clear_v4_key_cache
+from sqldeveloperconfig.preferences import clear_product_preferences_registry
+from sqldeveloperconfig.util import to_pretty_xml, set_search_roots, find_all_connection_paths, clear_installs_cache
+from test.sqldeveloperconfig.fake_install import make_fake_home
+
+
+def clear_caches():
+    clear_installs_cache()
+    clear_product_preferences_registry()
+    clear_v4_key_cache()
+
+
+def best_time(fn, repeat):
+    """
+    Returns the fastest of repeat runs of fn in seconds, with every cache cleared before each run
+    """
+    timings = []
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_scale(num_connections, num_installs, num_folders, pref_size, repeat):
+    with TemporaryDirectory() as home_dir:
+        root = make_fake_home(home_dir, num_installs, num_connections, num_folders, pref_size)
+        # Parsed by the real parser, which also sets the search roots, so the arguments follow the command line
+        set_passwords_args = parse_main_args(["--root", root, "set_passwords", "--password", "new password"])
+        set_passwords_args.install_errors = OrderedDict()
+        connections_path = find_all_connection_paths()[0]
+        connections = Connections(connections_path)
+        timings = OrderedDict()
+        timings["load"] = best_time(lambda: Connections(connections_path), repeat)
+        timings["load_streaming"] = best_time(lambda: Connections(connections_path, streaming=True), repeat)
+        timings["load_streaming_to_json"] = best_time(lambda: Connections(connections_path, streaming=True).to_json(), repeat)
+        timings["to_pretty_xml"] = best_time(lambda: to_pretty_xml(connections.to_xml_elem()), repeat)
+        timings["save_connections_and_folders"] = best_time(lambda: connections.save_connections_and_folders(connections_path, force=True), repeat)
+        timings["mod_set_passwords"] = best_time(lambda: mod_set_passwords(set_passwords_args), repeat)
+        set_search_roots(None)
+    result = OrderedDict()
+    result["connections"] = num_connections
+    result["installs"] = num_installs
+    result["folders"] = num_folders
+    result["pref_size"] = pref_size
+    result["timings"] = timings
+    return result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        "benchmark",
+        "python3 -m test.benchmark",
+        "Benchmark sqldeveloperconfig on fake SQLDeveloper homes",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("--scales", type=int, nargs="+", default=[100, 1000, 10000], help="Numbers of connections per install")
+    parser.add_argument("--installs", type=int, default=1, help="Number of installs in the fake home")
+    parser.add_argument("--folders", type=int, default=10, help="Number of folders per install")
+    parser.add_argument("--pref-size", type=int, default=1000000, help="Minimum size of product-preferences.xml in bytes")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per measurement, the fastest is reported")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output = OrderedDict()
+    output["python"] = platform.python_version()
+    output["repeat"] = args.repeat
+    output["results"] = [bench_scale(scale, args.installs, args.folders, args.pref_size, args.repeat) for scale in args.scales]
+    print(json.dumps(output, indent=2))
+
+
+if __name__ == "__main__":
+    main()
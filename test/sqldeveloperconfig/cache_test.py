@@ -0,0 +1,97 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from sqldeveloperconfig.cache import set_cache_dir, load_cached, store_cached, file_cache_stamp, clear_cache
+from sqldeveloperconfig.connections import Connections
+from sqldeveloperconfig.preferences import clear_product_preferences_registry, load_product_preferences, find_pref_path
+from sqldeveloperconfig.profiling import get_timings, reset_timings
+from sqldeveloperconfig.util import find_all_connection_paths
+from test.sqldeveloperconfig.fake_install import make_fake_home
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        set_cache_dir(os.path.join(self.temp_dir.name, "cache"))
+        clear_product_preferences_registry()
+
+    def tearDown(self):
+        set_cache_dir(None)
+        clear_product_preferences_registry()
+        self.temp_dir.cleanup()
+
+    def load(self, connections_path):
+        clear_product_preferences_registry()
+        reset_timings()
+        connections = Connections(connections_path)
+        return connections, get_timings()["counts"]
+
+    def test_cached_connections(self):
+        root = make_fake_home(self.temp_dir.name, num_connections=20, num_folders=3)
+        connections_path = find_all_connection_paths([root])[0]
+        parsed, counts = self.load(connections_path)
+        self.assertEqual(counts["cache_misses"], 2)
+        self.assertEqual(counts["cache_writes"], 2)
+        cached, counts = self.load(connections_path)
+        self.assertEqual(counts["cache_hits"], 2)
+        self.assertNotIn("preferences_parsed", counts)
+        self.assertIsNone(cached.prod_prefs._tree)
+        self.assertEqual(cached.to_json(), parsed.to_json())
+        self.assertEqual(cached.to_xml(), parsed.to_xml())
+        self.assertEqual(cached.prod_prefs.load_all_connection_dirs(), parsed.prod_prefs.load_all_connection_dirs())
+        self.assertEqual(cached.prod_prefs.find_connection_dir_names("folder1"), parsed.prod_prefs.find_connection_dir_names("folder1"))
+
+        cached.connections["[0 host4] user4"].folder = "folder2"
+        cached.save_connections_and_folders(connections_path, force=True)
+        changed, counts = self.load(connections_path)
+        self.assertEqual(counts["cache_misses"], 1)
+        self.assertEqual(counts["cache_hits"], 1)
+        self.assertEqual(changed.connections["[0 host4] user4"].folder, "folder2")
+        self.assertEqual(changed.to_json(), cached.to_json())
+
+    def test_stale_and_corrupt_entries(self):
+        file_path = os.path.join(self.temp_dir.name, "file.xml")
+        with open(file_path, "w") as new_file:
+            new_file.write("first")
+        store_cached("test", file_path, file_cache_stamp(file_path), [("a", None)])
+        self.assertEqual(load_cached("test", file_path, file_cache_stamp(file_path)), [("a", None)])
+        self.assertIsNone(load_cached("other", file_path, file_cache_stamp(file_path)))
+        with open(file_path, "a") as new_file:
+            new_file.write(" and more")
+        self.assertIsNone(load_cached("test", file_path, file_cache_stamp(file_path)))
+        store_cached("test", file_path, file_cache_stamp(file_path), "data")
+        for entry_name in os.listdir(os.path.join(self.temp_dir.name, "cache")):
+            with open(os.path.join(self.temp_dir.name, "cache", entry_name), "wb") as entry_file:
+                entry_file.write(b"\x00garbage")
+        self.assertIsNone(load_cached("test", file_path, file_cache_stamp(file_path)))
+        clear_cache()
+        self.assertEqual(os.listdir(os.path.join(self.temp_dir.name, "cache")), [])
+
+    def test_private_cache_dir(self):
+        file_path = os.path.join(self.temp_dir.name, "file.xml")
+        with open(file_path, "w") as new_file:
+            new_file.write("data")
+        cache_dir = os.path.join(self.temp_dir.name, "cache")
+        os.mkdir(cache_dir, 0o777)
+        os.chmod(cache_dir, 0o777)
+        store_cached("test", file_path, file_cache_stamp(file_path), "data")
+        self.assertEqual(os.stat(cache_dir).st_mode & 0o777, 0o700)
+
+    def test_lazy_preferences_tree(self):
+        root = make_fake_home(self.temp_dir.name)
+        pref_path = find_pref_path(find_all_connection_paths([root])[0])
+        load_product_preferences(pref_path)
+        clear_product_preferences_registry()
+        prefs = load_product_preferences(pref_path)
+        self.assertIsNone(prefs._tree)
+        prefs.update_all_connection_dirs({"new folder": ["[0 host1] user1"]})
+        self.assertIsNotNone(prefs._tree)
+        self.assertEqual(prefs.find_connection_dir("[0 host1] user1"), "new folder")
+        self.assertTrue(prefs.save_xml())
+        clear_product_preferences_registry()
+        self.assertEqual(load_product_preferences(pref_path).find_connection_dir_names("new folder"), ["[0 host1] user1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,15 @@
+import os
 import re
 import unittest
+from tempfile import TemporaryDirectory
 
-from sqldeveloperconfig.connections import Connections, Connection
+from sqldeveloperconfig.connections import Connections, Connection, iter_decrypted_connections, make_connections, check_connection_attrs
+from sqldeveloperconfig.connections import connections_transaction, install_lock
+from sqldeveloperconfig.cryption import encrypt_v4
+from sqldeveloperconfig.preferences import clear_product_preferences_registry
 from sqldeveloperconfig.util import find_all_connection_paths
-from test.sqldeveloperconfig.test_constants import DB_SYSTEM_ID
+from test.sqldeveloperconfig.fake_install import make_fake_home
+from test.sqldeveloperconfig.test_constants import DB_SYSTEM_ID, ENCRYPTED_PASSWORD, PLAINTEXT_PASSWORD
 
 FAKE_PASSWORD = "Ростов-на-Дону"
 
@@ -42,6 +48,208 @@ class TestConnections(unittest.TestCase):
                 clean_host_entry = re.sub(r"\n[\t ]*", "\n", EXPECTED_HOST_ENTRY)
                 self.assertTrue(clean_host_entry not in clean_content)
 
+    def test_plaintext_password_cache(self):
+        connection = Connection(DB_SYSTEM_ID, ConnName="cached", password=ENCRYPTED_PASSWORD)
+        self.assertFalse(connection.is_decrypted)
+        self.assertEqual(connection.plaintext_password, PLAINTEXT_PASSWORD)
+        self.assertTrue(connection.is_decrypted)
+        connection.encrypted_password = ""
+        self.assertFalse(connection.is_decrypted)
+        self.assertEqual(connection.plaintext_password, "")
+        connection.plaintext_password = FAKE_PASSWORD
+        self.assertTrue(connection.is_decrypted)
+        self.assertEqual(connection.plaintext_password, FAKE_PASSWORD)
+        connection.set("password", encrypt_v4("other", DB_SYSTEM_ID))
+        self.assertFalse(connection.is_decrypted)
+        self.assertEqual(connection.to_json()["plaintext_password"], "other")
+        self.assertIsNone(Connection(DB_SYSTEM_ID, ConnName="no password").plaintext_password)
+
+    def test_make_connections(self):
+        conn_attrs_list = [{"ConnName": "first", "plaintext_password": PLAINTEXT_PASSWORD}, {"ConnName": "second", "folder": "f"}]
+        first, second = make_connections(DB_SYSTEM_ID, conn_attrs_list)
+        self.assertEqual(first.encrypted_password, ENCRYPTED_PASSWORD)
+        self.assertEqual(first.get("SavePassword"), "true")
+        self.assertEqual(first.to_json(), Connection(DB_SYSTEM_ID, **conn_attrs_list[0]).to_json())
+        self.assertIsNone(second.encrypted_password)
+        self.assertEqual(second.folder, "f")
+        self.assertIn("plaintext_password", conn_attrs_list[0])
+        check_connection_attrs(conn_attrs_list[1])
+        for bad_attrs in [["ConnName"], {"port": 1521}]:
+            with self.assertRaises(Exception):
+                check_connection_attrs(bad_attrs)
+
+    def test_loading_does_not_decrypt(self):
+        for conn_path in find_all_connection_paths():
+            connections = Connections(conn_path)
+            for conn_name, conn in connections.items():
+                self.assertFalse(conn.is_decrypted)
+            connections.to_json()
+            for conn_name, conn in connections.items():
+                self.assertTrue(conn.is_decrypted)
+
+    def test_streaming_load(self):
+        for conn_path in find_all_connection_paths():
+            connections = Connections(conn_path)
+            streamed_connections = Connections(conn_path, streaming=True)
+            self.assertIsNone(streamed_connections.root)
+            self.assertEqual(streamed_connections.to_json(), connections.to_json())
+            self.assertEqual(streamed_connections.to_xml_doc(), connections.to_xml_doc())
+
+    def test_skip_unchanged_writes(self):
+        for conn_path in find_all_connection_paths():
+            connections = Connections(conn_path)
+            self.assertFalse(connections.is_modified)
+            self.assertFalse(connections.folders_modified)
+            self.assertFalse(connections.save_connections_and_folders(conn_path))
+            self.assertFalse(connections.prod_prefs.save_xml())
+            for conn_name, conn in connections.items():
+                conn.encrypted_password = conn.encrypted_password
+            self.assertTrue(connections.is_modified)
+            self.assertFalse(connections.folders_modified)
+            self.assertTrue(connections.save_connections(conn_path))
+            self.assertFalse(connections.save_folders())
+            self.assertFalse(connections.is_modified)
+            connection = Connection(DB_SYSTEM_ID, ConnName="test connection name", folder="test folder")
+            connections.add_connection(connection)
+            self.assertTrue(connections.folders_modified)
+            self.assertTrue(connections.save_connections_and_folders(conn_path))
+            self.assertFalse(connections.folders_modified)
+            connections.pop_connection(connection.name)
+            self.assertTrue(connections.save_connections_and_folders(conn_path))
+
+    def test_fake_install(self):
+        with TemporaryDirectory() as home_dir:
+            root = make_fake_home(home_dir, num_installs=2, num_connections=20, num_folders=3)
+            conn_paths = find_all_connection_paths([root])
+            self.assertEqual(len(conn_paths), 2)
+            connections = Connections(conn_paths[1])
+            conns_json = connections.to_json()
+            self.assertEqual(len(conns_json), 20)
+            conn_json = conns_json["[1 host4] user4"]
+            self.assertEqual(conn_json["plaintext_password"], "password4")
+            self.assertEqual(conn_json["folder"], "folder1")
+            self.assertEqual(conn_json["hostname"], "host4.example.com")
+
+    def test_iter_decrypted_connections(self):
+        with TemporaryDirectory() as home_dir:
+            root = make_fake_home(home_dir, num_connections=10, num_folders=3)
+            conn_path = find_all_connection_paths([root])[0]
+            streamed_json = [conn.to_json() for conn in iter_decrypted_connections(conn_path, batch_size=3)]
+            self.assertEqual(streamed_json, list(Connections(conn_path).to_json().values()))
+
+    def test_rekey(self):
+        with TemporaryDirectory() as home_dir:
+            root = make_fake_home(home_dir, num_connections=5, db_system_id="old-system-id")
+            connections_path = find_all_connection_paths([root])[0]
+            connections = Connections(connections_path)
+            connections.connections["[0 host4] user4"].plaintext_password = ""
+            with self.assertRaises(Exception):
+                connections.rekey("wrong-system-id", DB_SYSTEM_ID)
+            self.assertEqual(connections.rekey("old-system-id", DB_SYSTEM_ID), 4)
+            connections.save_connections(connections_path)
+            connections.prod_prefs.save_xml()
+            connections = Connections(connections_path)
+            self.assertEqual(connections.prod_prefs.db_system_id, DB_SYSTEM_ID)
+            passwords = [conn["plaintext_password"] for conn in connections.to_json().values()]
+            self.assertEqual(passwords, ["password0", "password1", "password2", "password3", None])
+            self.assertEqual(connections.rekey("old-system-id"), 0)
+            self.assertFalse(connections.is_modified)
+
+    def test_transaction(self):
+        with TemporaryDirectory() as home_dir:
+            clear_product_preferences_registry()
+            root = make_fake_home(home_dir, num_connections=5)
+            connections_path = find_all_connection_paths([root])[0]
+            with connections_transaction(connections_path) as connections:
+                connections.add_connection(Connection(DB_SYSTEM_ID, ConnName="added", plaintext_password="tiger"))
+                connections.pop_connection("[0 host0] user0")
+                connections.set_passwords({"[0 host1] user1": "new password", "added": "new tiger"})
+                connections.connections["[0 host2] user2"].folder = "moved"
+            connections = Connections(connections_path)
+            self.assertNotIn("[0 host0] user0", connections.connections)
+            self.assertEqual(connections.connections["added"].plaintext_password, "new tiger")
+            self.assertEqual(connections.connections["[0 host1] user1"].plaintext_password, "new password")
+            self.assertEqual(connections.connections["[0 host2] user2"].folder, "moved")
+
+            stamps = [os.stat(path).st_mtime_ns for path in (connections_path, connections.prod_prefs.file_path)]
+            with self.assertRaises(Exception):
+                with connections.transaction():
+                    connections.pop_connection("added")
+                    connections.connections["[0 host3] user3"].folder = "rolled back"
+                    connections.set_passwords({"missing": "password"})
+            self.assertIn("added", connections.connections)
+            self.assertEqual(connections.connections["[0 host3] user3"].folder, "folder1")
+            self.assertFalse(connections.is_modified or connections.folders_modified)
+            self.assertEqual([os.stat(path).st_mtime_ns for path in (connections_path, connections.prod_prefs.file_path)], stamps)
+
+            other = Connections(connections_path)
+            other.pop_connection("added")
+            other.commit()
+            connections.pop_connection("[0 host4] user4")
+            with self.assertRaises(Exception):
+                connections.commit()
+            connections.reload()
+            self.assertNotIn("added", connections.connections)
+            with connections.transaction():
+                connections.pop_connection("[0 host4] user4")
+            self.assertEqual(list(Connections(connections_path).connections), ["[0 host1] user1", "[0 host2] user2", "[0 host3] user3"])
+            self.assertEqual(sorted(os.listdir(os.path.dirname(connections_path))), ["connections.xml", "sqldeveloperconfig.lock"])
+
+    def test_indexes(self):
+        with TemporaryDirectory() as home_dir:
+            root = make_fake_home(home_dir, num_connections=12, num_folders=3)
+            connections = Connections(find_all_connection_paths([root])[0])
+            for attr in ["hostname", "folder", "ConnName"]:
+                connections.create_index(attr)
+            by_folder = connections.lookup("folder", "folder1")
+            self.assertEqual(list(by_folder), ["[0 host1] user1", "[0 host4] user4", "[0 host7] user7", "[0 host10] user10"])
+            self.assertEqual(list(connections.lookup("port", "1522")), ["[0 host1] user1", "[0 host11] user11"])
+            conn = by_folder["[0 host4] user4"]
+            conn.folder = "folder2"
+            conn.set("hostname", "moved.example.com")
+            self.assertEqual(len(by_folder), 3)
+            self.assertIs(connections.lookup("hostname", "moved.example.com")["[0 host4] user4"], conn)
+            self.assertEqual(len(connections.lookup("hostname", "host4.example.com")), 0)
+            connections_dict = connections.connections
+            names = list(connections_dict)
+            conn.name = "renamed"
+            self.assertIs(connections.connections, connections_dict)
+            self.assertEqual(list(connections_dict), [name if name != "[0 host4] user4" else "renamed" for name in names])
+            self.assertIs(connections.lookup("folder", "folder2")["renamed"], conn)
+            self.assertIs(connections.lookup("name", "renamed")["renamed"], conn)
+            self.assertIs(connections.connections["renamed"], conn)
+            with self.assertRaises(Exception):
+                conn.name = "[0 host1] user1"
+            connections.pop_connection("renamed")
+            self.assertEqual(len(connections.lookup("hostname", "moved.example.com")), 0)
+            connections.add_connection(Connection(DB_SYSTEM_ID, ConnName="added", hostname="host1.example.com", folder="folder1"))
+            self.assertEqual(list(connections.lookup("hostname", "host1.example.com")), ["[0 host1] user1", "added"])
+            self.assertEqual(list(by_folder), ["[0 host1] user1", "[0 host7] user7", "[0 host10] user10", "added"])
+            for missing in range(100):
+                self.assertEqual(len(connections.lookup("hostname", "missing{}".format(missing))), 0)
+            self.assertNotIn("missing0", connections._indexes["hostname"])
+            self.assertNotIn("moved.example.com", connections._indexes["hostname"])
+            self.assertNotIn("host4.example.com", connections._indexes["hostname"])
+
+    def test_shared_defaults(self):
+        conn = Connection(DB_SYSTEM_ID, ConnName="first", hostname="db.example.com", extra="1")
+        other = Connection(DB_SYSTEM_ID, ConnName="second", hostname="db.example.com", extra="2")
+        self.assertIs(conn._layout, other._layout)
+        self.assertEqual(sorted(conn._overrides), ["ConnName", "extra", "hostname"])
+        self.assertEqual(list(conn.attrs())[:4], ["ConnName", "hostname", "extra", "role"])
+        self.assertEqual(conn.get("driver"), "oracle.jdbc.OracleDriver")
+        conn.set("driver", "other.Driver")
+        conn.set("added", None)
+        self.assertEqual(conn.get("driver"), "other.Driver")
+        self.assertEqual(other.get("driver"), "oracle.jdbc.OracleDriver")
+        self.assertEqual(list(conn.attrs())[-1], "added")
+        self.assertIsNone(conn.get("added", "missing"))
+        self.assertEqual(conn.get("missing", "default"), "default")
+        conn.set("driver", "oracle.jdbc.OracleDriver")
+        self.assertNotIn("driver", conn._overrides)
+        with self.assertRaises(AttributeError):
+            conn.unknown = 1
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,7 +1,13 @@
+import importlib.util
+import os
 import unittest
+from unittest import mock
 
-from sqldeveloperconfig.cryption import encrypt_v4, decrypt_v4
-from test.sqldeveloperconfig.test_constants import PLAINTEXT_PASSWORD, ENCRYPTED_PASSWORD, DB_SYSTEM_ID
+from sqldeveloperconfig.crypto_backends import CRYPTO_BACKEND_ENV_VAR, set_crypto_backend, get_crypto_backend, available_crypto_backends
+from sqldeveloperconfig.crypto_backends import load_crypto_backend, check_crypto_backend, CryptoBackend, PycryptodomexBackend, CryptographyBackend
+from sqldeveloperconfig.cryption import encrypt_v4, decrypt_v4, v4_key_cache_info, clear_v4_key_cache, v4_salt_iv, encrypt_v4_many, decrypt_v4_many
+from sqldeveloperconfig.cryption import try_decrypt_v4_many
+from test.sqldeveloperconfig.test_constants import PLAINTEXT_PASSWORD, ENCRYPTED_PASSWORD, DB_SYSTEM_ID, V4_KNOWN_ANSWERS, V4_KEY_KNOWN_ANSWERS
 
 
 class TestCryption(unittest.TestCase):
@@ -16,6 +22,104 @@ class TestCryption(unittest.TestCase):
         plaintext_password = decrypt_v4("", DB_SYSTEM_ID)
         self.assertEqual(plaintext_password, "")
 
+    def test_v4_key_cache(self):
+        clear_v4_key_cache()
+        self.assertEqual(v4_key_cache_info().currsize, 0)
+        for _ in range(10):
+            self.assertEqual(decrypt_v4(ENCRYPTED_PASSWORD, DB_SYSTEM_ID), PLAINTEXT_PASSWORD)
+            self.assertEqual(encrypt_v4(PLAINTEXT_PASSWORD, DB_SYSTEM_ID), ENCRYPTED_PASSWORD)
+        cache_info = v4_key_cache_info()
+        self.assertEqual(cache_info.misses, 1)
+        self.assertEqual(cache_info.hits, 19)
+        self.assertEqual(cache_info.currsize, 1)
+        for i in range(cache_info.maxsize + 1):
+            v4_salt_iv("system-id-{}".format(i))
+        self.assertEqual(v4_key_cache_info().currsize, cache_info.maxsize)
+
+    def test_crypting_v4_many(self):
+        plaintext_passwords = [PLAINTEXT_PASSWORD, "", None, "Ростов-на-Дону", "exactly8", "a much longer password spanning blocks"]
+        encrypted_passwords = encrypt_v4_many(plaintext_passwords, DB_SYSTEM_ID)
+        self.assertEqual(encrypted_passwords[:3], [ENCRYPTED_PASSWORD, "", None])
+        for plaintext_password, encrypted_password in zip(plaintext_passwords[3:], encrypted_passwords[3:]):
+            self.assertEqual(encrypted_password, encrypt_v4(plaintext_password, DB_SYSTEM_ID))
+        self.assertEqual(decrypt_v4_many(encrypted_passwords, DB_SYSTEM_ID), plaintext_passwords)
+        self.assertEqual(decrypt_v4_many([], DB_SYSTEM_ID), [])
+
+    def test_try_decrypt_v4_many(self):
+        other_encrypted = encrypt_v4_many(["other", "password{}".format(ENCRYPTED_PASSWORD)], "other-system-id")
+        encrypted_passwords = [ENCRYPTED_PASSWORD, "not base64!", "abc="] + other_encrypted
+        self.assertEqual(try_decrypt_v4_many(encrypted_passwords, DB_SYSTEM_ID), [PLAINTEXT_PASSWORD, None, None, None, None])
+        self.assertEqual(try_decrypt_v4_many(other_encrypted, "other-system-id"), ["other", "password{}".format(ENCRYPTED_PASSWORD)])
+
+
+class TestCryptoBackends(unittest.TestCase):
+    """
+    Runs the known answers through every installed crypto backend
+    """
+
+    def tearDown(self):
+        set_crypto_backend(None)
+        clear_v4_key_cache()
+
+    def test_known_answers(self):
+        self.assertIn("pycryptodomex", available_crypto_backends())
+        for name in available_crypto_backends():
+            with self.subTest(backend=name):
+                set_crypto_backend(name)
+                clear_v4_key_cache()
+                self.assertEqual(get_crypto_backend().name, name)
+                for db_system_id, key, iv in V4_KEY_KNOWN_ANSWERS:
+                    self.assertEqual(v4_salt_iv(db_system_id), (bytes.fromhex(key), bytes.fromhex(iv)))
+                for db_system_id, plaintext_password, encrypted_password in V4_KNOWN_ANSWERS:
+                    self.assertEqual(encrypt_v4(plaintext_password, db_system_id), encrypted_password)
+                    self.assertEqual(decrypt_v4(encrypted_password, db_system_id), plaintext_password)
+                    self.assertEqual(encrypt_v4_many([plaintext_password, None], db_system_id), [encrypted_password, None])
+                    self.assertEqual(decrypt_v4_many([encrypted_password, ""], db_system_id), [plaintext_password, ""])
+                    self.assertEqual(try_decrypt_v4_many([encrypted_password], db_system_id), [plaintext_password])
+
+    def test_selection(self):
+        self.assertIn(get_crypto_backend().name, available_crypto_backends())
+        with mock.patch.dict(os.environ, {CRYPTO_BACKEND_ENV_VAR: "pycryptodomex"}):
+            set_crypto_backend(None)
+            self.assertEqual(get_crypto_backend().name, "pycryptodomex")
+        with mock.patch.dict(os.environ, {CRYPTO_BACKEND_ENV_VAR: "unknown"}):
+            set_crypto_backend(None)
+            with self.assertRaises(Exception):
+                get_crypto_backend()
+        with self.assertRaises(Exception):
+            set_crypto_backend("unknown")
+        if "cryptography" not in available_crypto_backends():
+            with self.assertRaises(Exception):
+                load_crypto_backend("cryptography")
+
+    def test_wrong_backend(self):
+        class WrongBackend(PycryptodomexBackend):
+            def md5(self, data):
+                return bytes(16)
+
+        with self.assertRaises(Exception):
+            check_crypto_backend(WrongBackend())
+
+        class IncompleteBackend(CryptoBackend):
+            def new_ecb(self, key):
+                return None
+
+        with self.assertRaises(TypeError):
+            IncompleteBackend()
+
+    @unittest.skipIf(importlib.util.find_spec("cryptography") is None, "cryptography is not installed")
+    def test_cryptography_round_trip(self):
+        backends = [PycryptodomexBackend(), CryptographyBackend()]
+        for data_size in (8, 64, 4096):
+            key, iv, data = os.urandom(8), os.urandom(8), os.urandom(data_size)
+            for encrypting, decrypting in (backends, reversed(backends)):
+                ecb_encrypted = encrypting.new_ecb(key).encrypt(data)
+                self.assertEqual(decrypting.new_ecb(key).encrypt(data), ecb_encrypted)
+                self.assertEqual(decrypting.new_ecb(key).decrypt(ecb_encrypted), data)
+                cbc_encrypted = encrypting.new_cbc(key, iv).encrypt(data)
+                self.assertEqual(decrypting.new_cbc(key, iv).encrypt(data), cbc_encrypted)
+                self.assertEqual(decrypting.new_cbc(key, iv).decrypt(cbc_encrypted), data)
+
 
 if __name__ == "__main__":
     unittest.main()
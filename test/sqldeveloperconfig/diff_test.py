@@ -0,0 +1,91 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import unittest
+from tempfile import TemporaryDirectory
+
+from sqldeveloperconfig.connections import Connections, Connection
+from sqldeveloperconfig.diff import diff_connections, diff_connections_files
+from sqldeveloperconfig.preferences import clear_product_preferences_registry
+from sqldeveloperconfig.util import find_all_connection_paths
+from test.sqldeveloperconfig.fake_install import make_fake_home
+from test.sqldeveloperconfig.main_test import REPO_DIR
+
+
+class TestDiff(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        clear_product_preferences_registry()
+        old_root = make_fake_home(os.path.join(self.temp_dir.name, "old"), num_connections=6)
+        new_root = make_fake_home(os.path.join(self.temp_dir.name, "new"), num_connections=6, db_system_id="other-system-id")
+        self.old_path = find_all_connection_paths([old_root])[0]
+        self.new_path = find_all_connection_paths([new_root])[0]
+
+    def tearDown(self):
+        clear_product_preferences_registry()
+        self.temp_dir.cleanup()
+
+    def test_diff(self):
+        new_connections = Connections(self.new_path)
+        new_connections.connections["[0 host1] user1"].folder = "moved"
+        new_connections.connections["[0 host2] user2"].set("port", "1600")
+        new_connections.connections["[0 host2] user2"].set("serviceName", "svc")
+        new_connections.connections["[0 host3] user3"].plaintext_password = "new password"
+        new_connections.pop_connection("[0 host4] user4")
+        new_connections.add_connection(Connection("other-system-id", ConnName="added", user="scott", plaintext_password="tiger"))
+        reordered = new_connections.connections["[0 host5] user5"]
+        new_connections.add_connection(Connection("other-system-id", folder=reordered.folder, **dict(reversed(reordered.attrs().items()))))
+        new_connections.save_connections_and_folders(self.new_path)
+
+        diff = diff_connections_files(self.old_path, self.new_path, compare_passwords=True)
+        self.assertEqual(list(diff["added"]), ["added"])
+        self.assertEqual(diff["added"]["added"]["plaintext_password"], "tiger")
+        self.assertEqual(list(diff["removed"]), ["[0 host4] user4"])
+        self.assertEqual(list(diff["changed"]), ["[0 host1] user1", "[0 host2] user2", "[0 host3] user3"])
+        self.assertEqual(diff["changed"]["[0 host1] user1"]["changed"], {"folder": {"old": "folder1", "new": "moved"}})
+        self.assertEqual(diff["changed"]["[0 host2] user2"]["changed"], {"port": {"old": "1523", "new": "1600"}})
+        self.assertEqual(diff["changed"]["[0 host2] user2"]["added"], {"serviceName": "svc"})
+        self.assertEqual(diff["changed"]["[0 host3] user3"]["changed"], {"plaintext_password": {"old": "password3", "new": "new password"}})
+        self.assertEqual(diff["unchanged"], 2)
+
+        diff = diff_connections_files(self.old_path, self.new_path)
+        self.assertNotIn("plaintext_password", diff["added"]["added"])
+        self.assertEqual(len(diff["changed"]), 5)
+        self.assertEqual(list(diff["changed"]["[0 host0] user0"]["changed"]), ["password"])
+
+    def test_same_file(self):
+        old_connections = Connections(self.old_path, streaming=True)
+        diff = diff_connections(old_connections, Connections(self.old_path), compare_passwords=True)
+        self.assertEqual((diff["added"], diff["removed"], diff["changed"], diff["unchanged"]), ({}, {}, {}, 6))
+        with self.assertRaises(Exception):
+            diff_connections_files(self.old_path, os.path.join(self.temp_dir.name, "missing.xml"))
+
+    def test_standalone_files(self):
+        standalone_dir = os.path.join(self.temp_dir.name, "standalone")
+        os.mkdir(standalone_dir)
+        old_path = os.path.join(standalone_dir, "a.xml")
+        new_path = os.path.join(standalone_dir, "b.xml")
+        shutil.copy(self.old_path, old_path)
+        new_connections = Connections(self.old_path)
+        new_connections.connections["[0 host1] user1"].set("port", "1600")
+        new_connections.connections["[0 host2] user2"].folder = "moved"
+        new_connections.save_connections(new_path)
+        diff = diff_connections_files(old_path, new_path)
+        self.assertEqual(list(diff["changed"]), ["[0 host1] user1"])
+        self.assertEqual(diff["unchanged"], 5)
+        diff = diff_connections_files(self.old_path, new_path)
+        self.assertEqual(list(diff["changed"]), ["[0 host1] user1"])
+        with self.assertRaises(Exception):
+            diff_connections_files(old_path, new_path, compare_passwords=True)
+
+        env = dict(os.environ, PYTHONPATH=REPO_DIR)
+        completed = subprocess.run([sys.executable, "-m", "sqldeveloperconfig", "diff", old_path, "missing.xml"], env=env, capture_output=True)
+        self.assertEqual(completed.returncode, 1)
+        self.assertNotIn(b"Traceback", completed.stderr)
+        self.assertIn("missing.xml", json.loads(completed.stdout.decode("utf8"))["errors"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Generates fake SQLDeveloper homes for tests and benchmarks, without needing SQLDeveloper
+"""
+
+import os
+from os.path import join
+from xml.sax.saxutils import quoteattr, escape
+
+from sqldeveloperconfig.constants import XML_DOCTYPE
+from sqldeveloperconfig.cryption import encrypt_v4_many
+from test.sqldeveloperconfig.test_constants import DB_SYSTEM_ID
+
+REFERENCE_XML = """  <Reference name={name} className="oracle.jdeveloper.db.adapter.DatabaseProvider" xmlns="">
+    <Factory className="oracle.jdevimpl.db.adapter.DatabaseProviderFactory1212" />
+    <RefAddresses>
+{ref_addresses}
+    </RefAddresses>
+  </Reference>
+"""
+
+STRING_REF_ADDR_XML = """      <StringRefAddr addrType={addr_type}>
+        <Contents>{contents}</Contents>
+      </StringRefAddr>"""
+
+
+def fake_conn_name(install_num, conn_num):
+    return "[{} host{}] user{}".format(install_num, conn_num, conn_num)
+
+
+def fake_conn_attrs(install_num, conn_num, encrypted_password):
+    hostname = "host{}.example.com".format(conn_num)
+    port = str(1521 + conn_num % 10)
+    sid = "sid{}".format(conn_num % 100)
+    return [
+        ("role", None),
+        ("SavePassword", "true"),
+        ("OracleConnectionType", "BASIC"),
+        ("RaptorConnectionType", "Oracle"),
+        ("sid", sid),
+        ("customUrl", "jdbc:oracle:thin:@{}:{}:{}".format(hostname, port, sid)),
+        ("password", encrypted_password),
+        ("oraDriverType", "thin"),
+        ("NoPasswordConnection", "TRUE"),
+        ("hostname", hostname),
+        ("driver", "oracle.jdbc.OracleDriver"),
+        ("port", port),
+        ("subtype", "oraJDBC"),
+        ("OS_AUTHENTICATION", "false"),
+        ("user", "user{}".format(conn_num)),
+        ("KERBEROS_AUTHENTICATION", "false"),
+        ("ConnName", fake_conn_name(install_num, conn_num)),
+    ]
+
+
+def write_fake_connections(connections_path, install_num, num_connections, db_system_id):
+    plaintext_passwords = ["password{}".format(conn_num) for conn_num in range(num_connections)]
+    encrypted_passwords = encrypt_v4_many(plaintext_passwords, db_system_id)
+    with open(connections_path, "w") as conn_file:
+        conn_file.write(XML_DOCTYPE)
+        conn_file.write('<References xmlns="http://xmlns.oracle.com/adf/jndi">\n')
+        for conn_num, encrypted_password in enumerate(encrypted_passwords):
+            ref_addresses = []
+            for addr_type, contents in fake_conn_attrs(install_num, conn_num, encrypted_password):
+                ref_addresses.append(STRING_REF_ADDR_XML.format(addr_type=quoteattr(addr_type), contents=escape(contents or "")))
+            conn_file.write(REFERENCE_XML.format(name=quoteattr(fake_conn_name(install_num, conn_num)), ref_addresses="\n".join(ref_addresses)))
+        conn_file.write("</References>\n")
+
+
+def write_fake_preferences(pref_path, install_num, num_connections, num_folders, pref_size, db_system_id):
+    with open(pref_path, "w") as pref_file:
+        pref_file.write(XML_DOCTYPE)
+        pref_file.write('<ide:preferences xmlns:ide="http://xmlns.oracle.com/ide/hash">\n')
+        pref_file.write('  <value n="db.system.id" v={} />\n'.format(quoteattr(db_system_id)))
+        pref_file.write('  <hash n="DatabaseFoldersCache">\n    <hash n="Folders">\n      <hash n="IdeConnections">\n')
+        for folder_num in range(num_folders):
+            pref_file.write('        <list n="folder{}">\n'.format(folder_num))
+            for conn_num in range(folder_num, num_connections, num_folders):
+                pref_file.write("          <string v={} />\n".format(quoteattr(fake_conn_name(install_num, conn_num))))
+            pref_file.write("        </list>\n")
+        pref_file.write("      </hash>\n    </hash>\n  </hash>\n")
+        padding_num = 0
+        while pref_file.tell() < pref_size:
+            pref_file.write('  <value n="padding.{}" v="{}" />\n'.format(padding_num, "x" * 64))
+            padding_num += 1
+        pref_file.write("</ide:preferences>\n")
+
+
+def make_fake_home(home_dir, num_installs=1, num_connections=10, num_folders=2, pref_size=0, db_system_id=DB_SYSTEM_ID):
+    """
+    Writes num_installs installs under home_dir/.sqldeveloper, each with num_connections connections spread over num_folders
+    folders, and a product-preferences.xml padded to at least pref_size bytes. Returns the .sqldeveloper root.
+    The password of connection n is "password<n>".
+    """
+    root = join(home_dir, ".sqldeveloper")
+    for install_num in range(num_installs):
+        system_dir = join(root, "system{}.0.0".format(install_num))
+        connections_dir = join(system_dir, "o.jdeveloper.db.connection.{}.0.0".format(install_num))
+        pref_dir = join(system_dir, "o.sqldeveloper.{}.0.0".format(install_num))
+        os.makedirs(connections_dir)
+        os.makedirs(pref_dir)
+        write_fake_connections(join(connections_dir, "connections.xml"), install_num, num_connections, db_system_id)
+        write_fake_preferences(join(pref_dir, "product-preferences.xml"), install_num, num_connections, num_folders, pref_size, db_system_id)
+    return root
@@ -0,0 +1,27 @@
+import subprocess
+import sys
+import unittest
+
+from test.sqldeveloperconfig.main_test import REPO_DIR
+
+LAZY_IMPORT_SCRIPT = """
+import sys
+from sqldeveloperconfig.lazy import lazy_import
+
+lazy_module = lazy_import("xml.dom.minidom")
+assert "xml.dom.minicompat" not in sys.modules
+import xml.dom.minidom
+
+assert xml.dom.minidom is lazy_module
+assert xml.dom.minidom.parseString("<a/>").documentElement.tagName == "a"
+assert "xml.dom.minicompat" in sys.modules
+"""
+
+
+class TestLazy(unittest.TestCase):
+    def test_lazy_import(self):
+        subprocess.run([sys.executable, "-c", LAZY_IMPORT_SCRIPT], cwd=REPO_DIR, check=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import unittest
+from tempfile import TemporaryDirectory
+
+from test.benchmark import bench_scale
+from test.sqldeveloperconfig.fake_install import make_fake_home
+from test.sqldeveloperconfig.test_constants import ENCRYPTED_PASSWORD, DB_SYSTEM_ID
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+# Microseconds of imports allowed for each subcommand, on top of what the interpreter imports by itself
+IMPORT_TIME_BUDGETS = {
+    "--help": 60000,
+    "manual_show": 80000,
+    "auto_show": 100000,
+}
+
+# Modules only other subcommands need. A lazy import is not listed by -X importtime when it loads, the modules it imports are
+HEAVY_MODULES = ("Cryptodome.Util", "xml.etree.ElementPath", "pyexpat", "getpass", "socketserver", "concurrent.futures.process")
+
+# Modules of the subcommands that none of the checked ones run
+SUBCOMMAND_MODULES = ("sqldeveloperconfig.diff", "sqldeveloperconfig.sync", "sqldeveloperconfig.query", "sqldeveloperconfig.server")
+
+
+def run_import_time(args, home):
+    """
+    Runs a python command with -X importtime, returns {top level module: cumulative microseconds} and the set of all imported modules
+    """
+    # Selecting the fastest crypto backend loads every installed one, which is not the import time being measured
+    env = dict(os.environ, HOME=home, PYTHONPATH=REPO_DIR, SQLDEVELOPERCONFIG_CRYPTO_BACKEND="pycryptodomex")
+    completed = subprocess.run([sys.executable, "-X", "importtime"] + args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+    top_level_times = {}
+    modules = set()
+    for line in completed.stderr.decode("utf8").splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            modules.add(match.group(4))
+            if not match.group(3):
+                top_level_times[match.group(4)] = int(match.group(2))
+    return top_level_times, modules
+
+
+class TestStartup(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        make_fake_home(self.temp_dir.name, num_connections=4)
+        self.baseline_times, self.baseline_modules = run_import_time(["-c", "pass"], self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def check_startup(self, subcommand, args, heavy_modules):
+        top_level_times, modules = run_import_time(["-m", "sqldeveloperconfig"] + args, self.temp_dir.name)
+        import_time = sum(cumulative for module, cumulative in top_level_times.items() if module not in self.baseline_modules)
+        self.assertLess(import_time, IMPORT_TIME_BUDGETS[subcommand], "{} spends {}us importing".format(subcommand, import_time))
+        for module in modules:
+            self.assertFalse(module.startswith(heavy_modules), "{} imports {}".format(subcommand, module))
+
+    def test_help(self):
+        self.check_startup("--help", ["--help"], HEAVY_MODULES + SUBCOMMAND_MODULES + ("sqldeveloperconfig.crypto_backends",))
+
+    def test_manual_show(self):
+        args = ["manual_show", "-p", ENCRYPTED_PASSWORD, "-d", DB_SYSTEM_ID]
+        self.check_startup("manual_show", args, tuple(module for module in HEAVY_MODULES if module != "Cryptodome.Util") + SUBCOMMAND_MODULES)
+
+    def test_auto_show(self):
+        self.check_startup("auto_show", ["auto_show"], ("getpass", "socketserver", "concurrent.futures.process") + SUBCOMMAND_MODULES)
+
+
+class TestWorkers(unittest.TestCase):
+    def test_spawned_workers_get_options(self):
+        with TemporaryDirectory() as temp_dir:
+            root = make_fake_home(os.path.join(temp_dir, "home"), num_installs=2, num_connections=4)
+            cache_dir = os.path.join(temp_dir, "cache")
+            # Python starts with the sitecustomize found on its path, which makes the workers spawned rather than forked
+            with open(os.path.join(temp_dir, "sitecustomize.py"), "w") as sitecustomize:
+                sitecustomize.write("import multiprocessing\nmultiprocessing.set_start_method('spawn')\n")
+            args = ["--root", root, "--cache", "--crypto-backend", "pycryptodomex", "--jobs", "2", "--profile", "auto_show"]
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join([temp_dir, REPO_DIR]), XDG_CACHE_HOME=cache_dir, HOME=temp_dir)
+            env.pop("SQLDEVELOPERCONFIG_CACHE_DIR", None)
+            completed = subprocess.run([sys.executable, "-m", "sqldeveloperconfig"] + args, env=env, stdout=subprocess.PIPE, check=True)
+            output = json.loads(completed.stdout.decode("utf8"))
+            self.assertEqual(len(output["result"]), 2)
+            self.assertEqual(output["timings"]["counts"]["cache_writes"], 4)
+
+
+class TestNdjson(unittest.TestCase):
+    def test_reader_going_away(self):
+        with TemporaryDirectory() as temp_dir:
+            make_fake_home(temp_dir, num_connections=2000)
+            env = dict(os.environ, HOME=temp_dir, PYTHONPATH=REPO_DIR)
+            args = [sys.executable, "-m", "sqldeveloperconfig", "auto_show", "--format", "ndjson"]
+            with subprocess.Popen(args, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as process:
+                self.assertIn("plaintext_password", json.loads(process.stdout.readline().decode("utf8")))
+                process.stdout.close()
+                stderr = process.stderr.read()
+            self.assertEqual(process.returncode, 0)
+            self.assertEqual(stderr, b"")
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_bench_scale(self):
+        result = bench_scale(5, num_installs=1, num_folders=1, pref_size=0, repeat=1)
+        self.assertIn("mod_set_passwords", result["timings"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,33 @@
 import unittest
+from os.path import join
+from tempfile import TemporaryDirectory
 
-from sqldeveloperconfig.preferences import ProductPreferences, find_all_pref_paths, find_pref_path, find_db_system_id
+from sqldeveloperconfig.preferences import (
+    ProductPreferences,
+    find_all_pref_paths,
+    find_pref_path,
+    find_db_system_id,
+    load_product_preferences,
+    read_db_system_id,
+)
 from sqldeveloperconfig.util import find_connections_path
 
+PREFS_XML = """<?xml version = '1.0' encoding = 'UTF-8'?>
+<ide:preferences xmlns:ide="http://xmlns.oracle.com/ide/hash">
+  <value n="db.system.id" v="1d5dbbd1-a91e-4298-9a5d-e13b55030b8f"/>
+  <hash n="DatabaseFoldersCache">
+    <hash n="Folders">
+      <hash n="IdeConnections">
+        <list n="local">
+          <string v="local one"/>
+          <string v="local two"/>
+        </list>
+      </hash>
+    </hash>
+  </hash>
+</ide:preferences>
+"""
+
 
 class TestPreferences(unittest.TestCase):
     def test_find_paths(self):
@@ -19,6 +44,40 @@ class TestPreferences(unittest.TestCase):
         db_system_id = preferences.db_system_id
         self.assertRegex(db_system_id, r"^[a-f0-9]*-[a-f0-9]*-[a-f0-9]*-[a-f0-9]*-[a-f0-9]*$")
 
+    def test_connection_dirs_index(self):
+        with TemporaryDirectory() as temp_dir:
+            pref_path = join(temp_dir, "product-preferences.xml")
+            with open(pref_path, "w") as pref_file:
+                pref_file.write(PREFS_XML)
+            preferences = ProductPreferences(pref_path)
+            self.assertEqual(preferences.find_connection_dir("local two"), "local")
+            self.assertIsNone(preferences.find_connection_dir("missing"))
+            preferences.update_all_connection_dirs({'it\'s "quoted"': ["local two"], "local": ["local one"]})
+            self.assertEqual(preferences.find_connection_dir("local two"), 'it\'s "quoted"')
+            self.assertEqual(preferences.find_connection_dir_names("local"), ["local one"])
+            preferences.update_all_connection_dirs({'it\'s "quoted"': ["local three"]})
+            self.assertIsNone(preferences.find_connection_dir("local two"))
+            self.assertTrue(preferences.save_xml())
+            reloaded_preferences = ProductPreferences(pref_path)
+            self.assertEqual(reloaded_preferences.load_all_connection_dirs(), {"local": ["local one"], 'it\'s "quoted"': ["local three"]})
+
+    def test_load_product_preferences(self):
+        with TemporaryDirectory() as temp_dir:
+            pref_path = join(temp_dir, "product-preferences.xml")
+            with open(pref_path, "w") as pref_file:
+                pref_file.write(PREFS_XML)
+            preferences = load_product_preferences(pref_path)
+            self.assertIs(load_product_preferences(pref_path), preferences)
+            self.assertEqual(read_db_system_id(pref_path), "1d5dbbd1-a91e-4298-9a5d-e13b55030b8f")
+            preferences.update_all_connection_dirs({"new": ["local one"]})
+            preferences.save_xml()
+            self.assertIs(load_product_preferences(pref_path), preferences)
+            with open(pref_path, "w") as pref_file:
+                pref_file.write(PREFS_XML.replace("1d5dbbd1", "2e6ecce2ff"))
+            reloaded_preferences = load_product_preferences(pref_path)
+            self.assertIsNot(reloaded_preferences, preferences)
+            self.assertEqual(reloaded_preferences.db_system_id, "2e6ecce2ff-a91e-4298-9a5d-e13b55030b8f")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+
+from sqldeveloperconfig.cryption import decrypt_v4_many, clear_v4_key_cache
+from sqldeveloperconfig.profiling import get_timings, reset_timings, add_timing_hook, remove_timing_hook, merge_timings
+from test.sqldeveloperconfig.test_constants import ENCRYPTED_PASSWORD, DB_SYSTEM_ID
+
+
+class TestProfiling(unittest.TestCase):
+    def test_timings(self):
+        hook_calls = []
+
+        def hook(phase, seconds):
+            hook_calls.append(phase)
+
+        clear_v4_key_cache()
+        reset_timings()
+        add_timing_hook(hook)
+        try:
+            decrypt_v4_many([ENCRYPTED_PASSWORD, ENCRYPTED_PASSWORD, ""], DB_SYSTEM_ID)
+        finally:
+            remove_timing_hook(hook)
+        timings = get_timings()
+        self.assertEqual(list(timings["seconds"]), ["key_derivation", "decrypt"])
+        self.assertEqual(timings["counts"], {"key_derivation": 1, "decrypt": 2})
+        self.assertEqual(hook_calls, ["key_derivation", "decrypt"])
+        merge_timings(timings)
+        self.assertEqual(get_timings()["counts"], {"key_derivation": 2, "decrypt": 4})
+        reset_timings()
+        self.assertEqual(get_timings()["counts"], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
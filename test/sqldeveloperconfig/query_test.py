@@ -0,0 +1,36 @@
+import unittest
+
+from sqldeveloperconfig.connections import Connection
+from sqldeveloperconfig.query import ConnectionQuery, parse_attr_arg
+from test.sqldeveloperconfig.test_constants import DB_SYSTEM_ID, ENCRYPTED_PASSWORD
+
+
+class TestQuery(unittest.TestCase):
+    def test_connection_query(self):
+        connections = {}
+        for conn_num in range(10):
+            conn_name = "[{} host] user{}".format(conn_num, conn_num)
+            connections[conn_name] = Connection(
+                DB_SYSTEM_ID,
+                ConnName=conn_name,
+                hostname="host{}.example.com".format(conn_num % 3),
+                port=str(1521 + conn_num % 2),
+                user="user{}".format(conn_num),
+                password=ENCRYPTED_PASSWORD,
+                folder="prod" if conn_num < 5 else "",
+            )
+        query = ConnectionQuery([("hostname", "host1.example.com")], [("folder", "^prod$"), ("user", r"\d")])
+        self.assertEqual([conn_name for conn_name, conn in query.select(connections)], ["[1 host] user1", "[4 host] user4"])
+        query = ConnectionQuery([parse_attr_arg("port=1522"), parse_attr_arg("role=")], [parse_attr_arg("name=^\\[[0-3] ")])
+        self.assertEqual([conn_name for conn_name, conn in query.select(connections)], [])
+        query = ConnectionQuery([parse_attr_arg("port=1522")], [parse_attr_arg("name=^\\[[0-3] "), ("role", "^$")])
+        self.assertEqual([conn_name for conn_name, conn in query.select(connections)], ["[1 host] user1", "[3 host] user3"])
+        self.assertEqual(len(ConnectionQuery().select(connections)), 10)
+        for conn in connections.values():
+            self.assertFalse(conn.is_decrypted)
+        with self.assertRaises(ValueError):
+            parse_attr_arg("no equals sign")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import threading
+import unittest
+from tempfile import TemporaryDirectory
+
+from sqldeveloperconfig.connections import Connections
+from sqldeveloperconfig.preferences import clear_product_preferences_registry, load_product_preferences
+from sqldeveloperconfig.server import ConnectionsServer, send_request, is_serving
+from sqldeveloperconfig.util import set_search_roots, find_all_connection_paths, clear_installs_cache
+from test.sqldeveloperconfig.fake_install import make_fake_home
+
+
+class TestServer(unittest.TestCase):
+    """
+    Runs the server in a thread on fake installs, without SQLDeveloper
+    """
+
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        root = make_fake_home(self.temp_dir.name, num_installs=2, num_connections=6, num_folders=2)
+        set_search_roots([root])
+        self.connections_paths = find_all_connection_paths()
+        self.socket_path = os.path.join(self.temp_dir.name, "server.sock")
+        self.server = ConnectionsServer(self.socket_path)
+        self.server_thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05})
+        self.server_thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server_thread.join()
+        self.server.server_close()
+        set_search_roots(None)
+        clear_installs_cache()
+        clear_product_preferences_registry()
+        self.temp_dir.cleanup()
+
+    def request(self, **request):
+        return send_request(self.socket_path, request)
+
+    def test_requests(self):
+        self.assertEqual(self.request(command="ping")["result"], "pong")
+        self.assertTrue(is_serving(self.socket_path))
+        self.assertEqual(os.stat(self.socket_path).st_mode & 0o777, 0o600)
+
+        result = self.request(command="show", where=[["hostname", "host3.example.com"]])["result"]
+        self.assertEqual(list(result), self.connections_paths)
+        self.assertEqual(result[self.connections_paths[1]]["connections"]["[1 host3] user3"]["plaintext_password"], "password3")
+
+        response = self.request(command="set_passwords", where=[["folder", "folder1"]], match=[["user", "user[15]"]], password="new password")
+        self.assertEqual(response["result"], ["[0 host1] user1", "[0 host5] user5", "[1 host1] user1", "[1 host5] user5"])
+        self.assertEqual(Connections(self.connections_paths[0]).connections["[0 host5] user5"].plaintext_password, "new password")
+
+        response = self.request(command="add_connections", connections=[{"ConnName": "added", "plaintext_password": "secret", "folder": "folder0"}])
+        self.assertEqual(response["result"][self.connections_paths[0]], {"added": 1, "replaced": 0})
+        self.assertEqual(Connections(self.connections_paths[1]).connections["added"].plaintext_password, "secret")
+
+    def test_reloads_changed_files(self):
+        self.request(command="show")
+        connections = Connections(self.connections_paths[0])
+        connections.connections["[0 host2] user2"].plaintext_password = "changed outside"
+        connections.save_connections(self.connections_paths[0])
+        result = self.request(command="show", where=[["user", "user2"]])["result"]
+        self.assertEqual(result[self.connections_paths[0]]["connections"]["[0 host2] user2"]["plaintext_password"], "changed outside")
+
+    def test_errors(self):
+        self.assertIn("Unknown command", self.request(command="unknown")["error"])
+        self.assertIn("Expected a password", self.request(command="set_passwords")["error"])
+        self.assertIn("Connection 2", self.request(command="add_connections", connections=[{"ConnName": "ok"}, {"port": 1521}])["error"])
+        self.assertNotIn("ok", Connections(self.connections_paths[0]).connections)
+        with self.assertRaises(Exception):
+            ConnectionsServer(self.socket_path)
+
+    def test_reset_forgets_preferences(self):
+        all_connections, errors = self.server.installs.load_all()
+        prod_prefs = all_connections[self.connections_paths[0]].prod_prefs
+        prod_prefs.update_all_connection_dirs({"half done": ["[0 host1] user1"]})
+        self.server.installs.reset()
+        self.assertIsNot(load_product_preferences(prod_prefs.file_path), prod_prefs)
+        all_connections, errors = self.server.installs.load_all()
+        self.assertEqual(all_connections[self.connections_paths[0]].prod_prefs.find_connection_dir("[0 host1] user1"), "folder1")
+
+
+if __name__ == "__main__":
+    unittest.main()
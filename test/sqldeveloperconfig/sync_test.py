@@ -0,0 +1,121 @@
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+from sqldeveloperconfig.connections import Connections
+from sqldeveloperconfig.cryption import clear_v4_key_cache
+from sqldeveloperconfig.preferences import clear_product_preferences_registry
+from sqldeveloperconfig.profiling import get_timings, reset_timings
+from sqldeveloperconfig.sync import read_catalog, sync_install, baseline_path
+from sqldeveloperconfig.util import find_all_connection_paths
+from test.sqldeveloperconfig.fake_install import make_fake_home
+
+
+def catalog_attrs(conn_name, user, port, plaintext_password):
+    return {"ConnName": conn_name, "user": user, "port": port, "plaintext_password": plaintext_password, "folder": "catalog"}
+
+
+class TestSync(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = TemporaryDirectory()
+        clear_product_preferences_registry()
+        root = make_fake_home(self.temp_dir.name, num_installs=3, num_connections=4)
+        self.connections_paths = find_all_connection_paths([root])
+
+    def tearDown(self):
+        clear_product_preferences_registry()
+        self.temp_dir.cleanup()
+
+    def sync_all(self, *catalog_list):
+        catalog = read_catalog(catalog_list)
+        return [sync_install(connections_path, catalog) for connections_path in self.connections_paths]
+
+    def load(self, install_num):
+        return Connections(self.connections_paths[install_num])
+
+    def save(self, install_num, connections):
+        connections.save_connections_and_folders(self.connections_paths[install_num])
+
+    def test_sync(self):
+        first = catalog_attrs("first", "scott", "1521", "tiger")
+        second = catalog_attrs("second", "hr", "1522", "hr password")
+        summaries = self.sync_all(first, second)
+        self.assertEqual([summary["added"] for summary in summaries], [["first", "second"]] * 3)
+        self.assertTrue(all(summary["written"] for summary in summaries))
+        self.assertEqual(self.load(1).connections["second"].plaintext_password, "hr password")
+        self.assertEqual(self.load(1).connections["second"].folder, "catalog")
+        self.assertTrue(os.path.isfile(baseline_path(self.connections_paths[0])))
+
+        stamps = [os.stat(connections_path).st_mtime_ns for connections_path in self.connections_paths]
+        clear_v4_key_cache()
+        reset_timings()
+        summaries = self.sync_all(first, second)
+        self.assertFalse(any(summary["written"] or summary["updated"] or summary["added"] for summary in summaries))
+        self.assertNotIn("key_derivation", get_timings()["counts"])
+        self.assertNotIn("files_written", get_timings()["counts"])
+        self.assertEqual([os.stat(connections_path).st_mtime_ns for connections_path in self.connections_paths], stamps)
+
+        local = self.load(0)
+        local.connections["first"].set("port", "1600")
+        local.connections["second"].plaintext_password = "local password"
+        self.save(0, local)
+        local = self.load(2)
+        local.pop_connection("first")
+        self.save(2, local)
+        first["user"] = "scott2"
+        second["plaintext_password"] = "new hr password"
+        summaries = self.sync_all(first, second)
+        self.assertEqual(summaries[0]["updated"], {"first": ["user"], "second": ["plaintext_password"]})
+        self.assertEqual(summaries[0]["conflicts"], {"second": ["plaintext_password"]})
+        self.assertEqual(self.load(0).connections["first"].get("port"), "1600")
+        self.assertEqual(self.load(0).connections["second"].plaintext_password, "new hr password")
+        self.assertEqual(summaries[2]["added"], ["first"])
+        self.assertEqual(summaries[2]["conflicts"], {"first": ["user"]})
+
+        local = self.load(1)
+        local.connections["second"].set("port", "1700")
+        self.save(1, local)
+        local = self.load(2)
+        local.pop_connection("first")
+        self.save(2, local)
+        summaries = self.sync_all(first)
+        self.assertEqual(summaries[0]["removed"], ["second"])
+        self.assertEqual(summaries[1]["removed"], [])
+        self.assertEqual(summaries[1]["conflicts"], {"second": ["port"]})
+        self.assertIn("second", self.load(1).connections)
+        self.assertNotIn("second", self.load(0).connections)
+        self.assertEqual(summaries[2]["added"], [])
+        self.assertNotIn("first", self.load(2).connections)
+
+    def test_aliased_attribute_names(self):
+        self.sync_all({"ConnName": "[0 host0] user0", "host": "raw host", "name": "raw name"})
+        connections = self.load(0)
+        self.assertEqual(connections.connections["[0 host0] user0"].attrs()["customUrl"], "jdbc:oracle:thin:@host0.example.com:1521:sid0")
+        self.assertEqual(connections.connections["[0 host0] user0"].attrs()["host"], "raw host")
+        self.assertEqual(self.load(1).connections["[0 host0] user0"].attrs()["host"], "raw host")
+        self.assertEqual(self.load(1).connections["[0 host0] user0"].attrs()["name"], "raw name")
+
+    def test_unchanged_sync_writes_nothing(self):
+        catalog = [catalog_attrs("added", "scott", "1521", "tiger"), {"ConnName": "[0 host0] user0", "user": "scott"}]
+        summaries = self.sync_all(*catalog)
+        self.assertTrue(all(summary["written"] for summary in summaries))
+        reset_timings()
+        summaries = self.sync_all(*catalog)
+        self.assertFalse(any(summary["written"] for summary in summaries))
+        self.assertNotIn("files_written", get_timings()["counts"])
+
+    def test_dry_run_and_bad_catalog(self):
+        catalog = read_catalog([catalog_attrs("first", "scott", "1521", "tiger")])
+        summary = sync_install(self.connections_paths[0], catalog, dry_run=True)
+        self.assertEqual(summary["added"], ["first"])
+        self.assertFalse(summary["written"])
+        self.assertNotIn("first", self.load(0).connections)
+        self.assertFalse(os.path.isfile(baseline_path(self.connections_paths[0])))
+        with self.assertRaises(Exception):
+            read_catalog([{"user": "scott"}])
+        with self.assertRaises(Exception):
+            read_catalog([{"ConnName": "first", "password": "mbAyyEhL9pY="}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,18 @@
 PLAINTEXT_PASSWORD = "oracle"
 ENCRYPTED_PASSWORD = "mbAyyEhL9pY="
 DB_SYSTEM_ID = "1d5dbbd1-a91e-4298-9a5d-e13b55030b8f"
+
+# db.system.id, plaintext password, encrypted password, that every crypto backend must give
+V4_KNOWN_ANSWERS = [
+    (DB_SYSTEM_ID, PLAINTEXT_PASSWORD, ENCRYPTED_PASSWORD),
+    (DB_SYSTEM_ID, "exactly8", "NfLeaqCxUktfEBvmPYD/9Q=="),
+    (DB_SYSTEM_ID, "Ростов-на-Дону", "nKRoVD78qt4ysU3ZDjCYL/MQ2Uga97Sf9L81yk5m82U="),
+    ("6b2f64b2-e83e-49a5-9abf-cb2cd7e3a9ee", "a much longer password spanning blocks", "HGaq810+h9WdGx344XMyYPkvHENXfiSSTVD96SIeto5QxVUuKrewkg=="),
+    ("6b2f64b2-e83e-49a5-9abf-cb2cd7e3a9ee", "x", "/AokW8zunQI="),
+]
+
+# db.system.id, DES key and IV derived from it
+V4_KEY_KNOWN_ANSWERS = [
+    (DB_SYSTEM_ID, "722152cccd9d5ff9", "39220a11125ce5f0"),
+    ("6b2f64b2-e83e-49a5-9abf-cb2cd7e3a9ee", "4053a9e0d8cc837f", "69b7a87b8a542571"),
+]
@@ -1,14 +1,27 @@
+import os
+import threading
 import unittest
+from unittest import mock
 import xml.etree.ElementTree as ET
+from copy import deepcopy
+from io import StringIO
+from os.path import join
+from tempfile import TemporaryDirectory
 
 from sqldeveloperconfig.preferences import find_pref_path
-from sqldeveloperconfig.util import indent_xml, to_pretty_xml, find_all_connection_paths, find_connections_path, ask_default, ask_yes_no
+from sqldeveloperconfig.util import indent_xml, to_pretty_xml, write_pretty_xml, find_all_connection_paths, find_connections_path, ask_default, ask_yes_no
+from sqldeveloperconfig.util import find_installs, clear_installs_cache, iter_json_values, atomic_write, file_lock
 
 EXPECTED_XML = """<Parent a="b">
   <Child is_baby="true" />
 </Parent>
 """
 
+NAMESPACED_XML = """<ide:preferences xmlns:ide="http://xmlns.oracle.com/ide/hash">
+<value n="db.system.id" v="&quot;Ростов&amp;"/><!-- comment -->
+<list n="empty">  </list><list n="text" xml:lang="en" note="a&#10;b&#13;&#9;&lt;&gt;">  kept &lt;&amp;&gt; </list>tail
+</ide:preferences>"""
+
 
 class TestUtils(unittest.TestCase):
     def test_to_pretty_xml(self):
@@ -18,6 +31,86 @@ class TestUtils(unittest.TestCase):
         xml_string = to_pretty_xml(elem)
         self.assertEqual(xml_string, EXPECTED_XML)
 
+    def test_write_pretty_xml(self):
+        elem = ET.fromstring(NAMESPACED_XML)
+        original_xml = ET.tostring(elem)
+        elem_copy = deepcopy(elem)
+        indent_xml(elem_copy)
+        pretty_xml = StringIO()
+        write_pretty_xml(elem, pretty_xml)
+        self.assertEqual(pretty_xml.getvalue(), ET.tostring(elem_copy).decode())
+        self.assertEqual(ET.tostring(elem), original_xml)
+
+    def test_write_deep_xml(self):
+        elem = ET.Element("Root")
+        leaf = elem
+        for _ in range(5000):
+            leaf = ET.SubElement(leaf, "Child")
+        pretty_xml = to_pretty_xml(elem)
+        self.assertTrue(pretty_xml.endswith("</Child>\n</Root>\n"))
+
+    def test_write_pretty_xml_children(self):
+        elem = ET.fromstring("<Root><A n='1'><B>text</B></A><C /><D>tail</D></Root>")
+        pretty_xml = StringIO()
+        write_pretty_xml(ET.Element("Root"), pretty_xml, (child for child in elem))
+        self.assertEqual(pretty_xml.getvalue(), to_pretty_xml(elem))
+
+    def test_iter_json_values(self):
+        json_str = '[{"a": 1}, {"b": [2.5e3, true]}]\n{"c": "x"}\n{"d": -1}\n  [] 12345 null\n'
+        expected = [{"a": 1}, {"b": [2500.0, True]}, {"c": "x"}, {"d": -1}, 12345, None]
+        for chunk_size in [1, 2, 7, 1000]:
+            self.assertEqual(list(iter_json_values(StringIO(json_str), chunk_size)), expected)
+        with self.assertRaises(ValueError):
+            list(iter_json_values(StringIO('{"a": 1}\n{"b": '), 4))
+        with self.assertRaises(ValueError):
+            list(iter_json_values(StringIO('[{"a": 1}'), 4))
+
+    def test_atomic_write(self):
+        with TemporaryDirectory() as temp_dir:
+            file_path = join(temp_dir, "file.xml")
+            with atomic_write(file_path) as new_file:
+                new_file.write("first")
+            os.chmod(file_path, 0o640)
+            with self.assertRaises(KeyError):
+                with atomic_write(file_path) as new_file:
+                    new_file.write("partial")
+                    raise KeyError()
+            with open(file_path) as old_file:
+                self.assertEqual(old_file.read(), "first")
+            with atomic_write(file_path) as new_file:
+                new_file.write("second")
+            with open(file_path) as new_file:
+                self.assertEqual(new_file.read(), "second")
+            self.assertEqual(os.stat(file_path).st_mode & 0o777, 0o640)
+            self.assertEqual(os.listdir(temp_dir), ["file.xml"])
+            with mock.patch("os.fsync", wraps=os.fsync) as fsync:
+                with atomic_write(file_path) as new_file:
+                    new_file.write("third")
+            self.assertEqual(fsync.call_count, 2)
+
+    def test_file_lock(self):
+        with TemporaryDirectory() as temp_dir:
+            lock_path = join(temp_dir, "file.lock")
+            locked = threading.Event()
+            release = threading.Event()
+
+            def hold_lock():
+                with file_lock(lock_path):
+                    locked.set()
+                    release.wait()
+
+            holder = threading.Thread(target=hold_lock)
+            holder.start()
+            locked.wait()
+            with self.assertRaises(Exception):
+                with file_lock(lock_path, timeout=0.1):
+                    pass
+            release.set()
+            holder.join()
+            with file_lock(lock_path, timeout=1):
+                with file_lock(lock_path, timeout=0):
+                    pass
+
     def test_file_finding(self):
         all_conns_paths = find_all_connection_paths()
         self.assertEqual(1, len(all_conns_paths))
@@ -26,6 +119,36 @@ class TestUtils(unittest.TestCase):
         final_conns_path = find_connections_path(prefs_path)
         self.assertEqual(initial_conns_path, final_conns_path)
 
+    def test_multi_root_discovery(self):
+        with TemporaryDirectory() as temp_dir:
+            for user in ["alice", "bob"]:
+                for system_dir_name in ["system19.2.1", "system20.4.1", "not_a_system"]:
+                    system_dir = join(temp_dir, user, ".sqldeveloper", system_dir_name)
+                    os.makedirs(join(system_dir, "o.jdeveloper.db.connection.19.2.1"))
+                    os.makedirs(join(system_dir, "o.sqldeveloper.19.2.1"))
+                    open(join(system_dir, "o.jdeveloper.db.connection.19.2.1", "connections.xml"), "w").close()
+                    open(join(system_dir, "o.sqldeveloper.19.2.1", "product-preferences.xml"), "w").close()
+            roots = [join(temp_dir, "*", ".sqldeveloper"), join(temp_dir, "nobody", ".sqldeveloper")]
+            installs = find_installs(roots)
+            self.assertEqual(
+                [install.system_dir[len(temp_dir) :] for install in installs],
+                [
+                    "/alice/.sqldeveloper/system19.2.1",
+                    "/alice/.sqldeveloper/system20.4.1",
+                    "/bob/.sqldeveloper/system19.2.1",
+                    "/bob/.sqldeveloper/system20.4.1",
+                ],
+            )
+            self.assertIs(find_installs(roots), installs)
+            conns_paths = find_all_connection_paths(roots)
+            self.assertEqual(len(conns_paths), 4)
+            for install, conns_path in zip(installs, conns_paths):
+                self.assertEqual(install.connections_paths, [conns_path])
+                self.assertEqual(find_pref_path(conns_path), install.pref_paths[0])
+                self.assertEqual(find_connections_path(install.pref_paths[0]), conns_path)
+            clear_installs_cache()
+            self.assertIsNot(find_installs(roots), installs)
+
     def test_ask_default(self):
         user_input = ask_default("Test", default="Never", input_fn=lambda prompt: "")
         self.assertEqual(user_input, "Never")